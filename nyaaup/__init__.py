@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import functools
+import multiprocessing
 import sys
 from types import SimpleNamespace
 
@@ -9,6 +10,7 @@ from cloup import Context, HelpFormatter, HelpTheme, Style
 from rich.console import Console
 
 from nyaaup.auth import auth
+from nyaaup.bench import bench
 from nyaaup.up import up
 from nyaaup.utils import DefaultCommandGroup
 
@@ -74,7 +76,11 @@ def main(ctx: Context, **kwargs):
 
 
 main.add_command(auth)
+main.add_command(bench)
 main.add_command(up)
 
 if __name__ == "__main__":
+    # In the PyInstaller build, spawned MediaInfo workers start this script again
+    # and have to run the worker instead of the CLI
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,407 @@
+import shutil
+import sys
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+from types import SimpleNamespace
+
+import cloup
+import humanize
+import orjson
+from rich.console import Console
+from rich.table import Table
+
+from nyaaup.utils.bench import (
+    DATASETS,
+    MEDIA_FIXTURES,
+    PROBE_METHODS,
+    create_dataset,
+    create_media,
+    drop_cache,
+    host_info,
+    reference_description,
+    run_backend,
+    run_probe,
+    warm_up,
+)
+from nyaaup.utils.creator import BACKENDS, available_backends
+from nyaaup.utils.hasher import ReadOptions
+from nyaaup.utils.logging import eprint, iprint, wprint
+from nyaaup.utils.torrent import get_piece_size
+
+PIECE_SIZES = ("auto", "256K", "1M", "4M", "16M")
+
+
+def _parse_piece_size(value: str, total_size: int) -> int:
+    if value.lower() == "auto":
+        return get_piece_size(total_size)
+
+    units = {"K": 1024, "M": 1024**2}
+    value = value.upper().removesuffix("IB").removesuffix("B")
+    try:
+        size = int(value[:-1]) * units[value[-1]] if value[-1] in units else int(value)
+    except (ValueError, IndexError):
+        eprint(f"Invalid piece size: {value}", True)
+
+    if size < 16 * 1024 or size & (size - 1):
+        eprint(f"Piece size must be a power of two of at least 16K: {value}", True)
+
+    return size
+
+
+@cloup.group()
+def bench():
+    """Benchmark torrent creation and MediaInfo probing"""
+
+
+@bench.command()
+@cloup.option_group(
+    "Dataset",
+    cloup.option(
+        "-s",
+        "--size",
+        type=cloup.IntRange(min=1),
+        default=1024,
+        show_default=True,
+        metavar="MiB",
+        help="Total dataset size in MiB.",
+    ),
+    cloup.option(
+        "-d",
+        "--dataset",
+        type=cloup.Choice(DATASETS),
+        multiple=True,
+        help="Dataset layout: one file or a batch of files. [default: all]",
+    ),
+    cloup.option(
+        "-f",
+        "--files",
+        type=cloup.IntRange(min=1),
+        default=24,
+        show_default=True,
+        help="Number of files in the multi-file dataset.",
+    ),
+    cloup.option(
+        "--dir",
+        type=cloup.path(path_type=Path, file_okay=False),
+        default=None,
+        help="Directory to create the dataset in. [default: temporary directory]",
+    ),
+    cloup.option(
+        "--keep",
+        is_flag=True,
+        default=False,
+        help="Keep the generated dataset for later runs.",
+    ),
+)
+@cloup.option_group(
+    "Benchmark",
+    cloup.option(
+        "-b",
+        "--backend",
+        type=cloup.Choice(BACKENDS),
+        multiple=True,
+        help="Torrent creator to benchmark. [default: all installed]",
+    ),
+    cloup.option(
+        "-p",
+        "--piece-size",
+        type=str,
+        multiple=True,
+        help=f"Piece size like 256K or 4M, or auto. [default: {', '.join(PIECE_SIZES)}]",
+    ),
+    cloup.option(
+        "-t",
+        "--threads",
+        type=cloup.IntRange(min=1),
+        default=None,
+        help="Hashing threads. [default: cpu count]",
+    ),
+    cloup.option(
+        "--read-size",
+        type=cloup.IntRange(min=1),
+        default=8,
+        show_default=True,
+        metavar="MiB",
+        help="Read size of the native hasher.",
+    ),
+    cloup.option(
+        "--drop-cache",
+        is_flag=True,
+        default=False,
+        help="Native hasher drops what it read from the page cache.",
+    ),
+    cloup.option(
+        "--direct-io",
+        is_flag=True,
+        default=False,
+        help="Native hasher reads with O_DIRECT.",
+    ),
+    cloup.option(
+        "-r",
+        "--repeat",
+        type=cloup.IntRange(min=1),
+        default=1,
+        show_default=True,
+        help="Runs per combination, the fastest is reported.",
+    ),
+    cloup.option(
+        "--cold",
+        is_flag=True,
+        default=False,
+        help="Drop the dataset from the page cache before every run.",
+    ),
+    cloup.option(
+        "--json",
+        "json_path",
+        type=cloup.path(path_type=Path, dir_okay=False),
+        default=None,
+        help="Write results as JSON to FILE.",
+    ),
+)
+@cloup.pass_context
+def torrent(ctx, **kwargs):
+    """Benchmark torrent hashing across backends and piece sizes"""
+    if any(x in sys.argv for x in ctx.help_option_names):
+        return
+
+    args = SimpleNamespace(**kwargs)
+    console = Console()
+    size = args.size * 1024 * 1024
+
+    backends = list(args.backend) or available_backends()
+    if "torrenttools" in backends and "torrenttools" not in available_backends():
+        wprint("torrenttools not found, skipping.")
+        backends.remove("torrenttools")
+    if not backends:
+        eprint("No torrent creator available.", True)
+
+    piece_sizes = {x: _parse_piece_size(x, size) for x in args.piece_size or PIECE_SIZES}
+
+    options = ReadOptions(
+        read_size=args.read_size * 1024 * 1024,
+        drop_cache=args.drop_cache,
+        direct_io=args.direct_io,
+    )
+
+    directory = args.dir or Path(tempfile.mkdtemp(prefix="nyaaup-bench-"))
+    results = []
+    try:
+        for kind in args.dataset or DATASETS:
+            iprint(f"Creating {kind} dataset ({humanize.naturalsize(size, True)})...", 0)
+            path = create_dataset(directory, kind, size, args.files)
+
+            for label, piece_size in piece_sizes.items():
+                for backend in backends:
+                    runs = []
+                    for _ in range(args.repeat):
+                        if args.cold:
+                            drop_cache(path)
+                        runs.append(
+                            run_backend(
+                                backend, kind, path, piece_size, args.threads, options
+                            )
+                        )
+                    best = min(runs, key=lambda x: x.seconds)
+                    results.append((label, best))
+                    console.print(
+                        f"[dim]{kind:<6} {label:>4} {backend:<12} "
+                        f"{best.mb_per_s:>9.1f} MB/s[/]"
+                    )
+    finally:
+        if not args.keep:
+            if args.dir:
+                for kind in DATASETS:
+                    for path in directory.glob(f"{kind}_{size}*"):
+                        if path.is_dir():
+                            shutil.rmtree(path)
+                        else:
+                            path.unlink()
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    table = Table(title="Torrent hashing", title_style="bold")
+    for column in ("Dataset", "Piece size", "Backend", "Time", "MB/s", "CPU", "Peak RSS"):
+        table.add_column(
+            column, justify="left" if column in ("Dataset", "Backend") else "right"
+        )
+
+    for label, result in results:
+        piece_size = humanize.naturalsize(result.piece_size, True, format="%.0f")
+        table.add_row(
+            result.dataset,
+            f"{piece_size} (auto)" if label == "auto" else piece_size,
+            result.backend,
+            f"{result.seconds:.2f}s",
+            f"{result.mb_per_s:.1f}",
+            f"{result.cpu_percent:.0f}%",
+            humanize.naturalsize(result.peak_rss, True) if result.peak_rss else "-",
+        )
+    console.print()
+    console.print(table)
+
+    if args.json_path:
+        data = orjson.dumps(
+            {
+                **host_info(),
+                "cold": args.cold,
+                "threads": args.threads,
+                "read_options": asdict(options),
+                "results": [
+                    {**result.to_dict(), "auto": label == "auto"}
+                    for label, result in results
+                ],
+            },
+            option=orjson.OPT_INDENT_2,
+        )
+        args.json_path.write_bytes(data)
+        iprint(f"Results written to {args.json_path}", 1, 0)
+
+
+@bench.command()
+@cloup.argument(
+    "paths",
+    nargs=-1,
+    type=cloup.path(exists=True, dir_okay=False, path_type=Path),
+)
+@cloup.option_group(
+    "Fixtures",
+    cloup.option(
+        "-s",
+        "--size",
+        type=cloup.IntRange(min=1),
+        default=256,
+        show_default=True,
+        metavar="MiB",
+        help="Size of every generated episode in MiB.",
+    ),
+    cloup.option(
+        "-f",
+        "--fixture",
+        type=cloup.Choice(MEDIA_FIXTURES),
+        multiple=True,
+        help="Episode to generate when no PATHS are given. [default: all]",
+    ),
+    cloup.option(
+        "--dir",
+        type=cloup.path(path_type=Path, file_okay=False),
+        default=None,
+        help="Directory to create the episodes in. [default: temporary directory]",
+    ),
+    cloup.option(
+        "--keep",
+        is_flag=True,
+        default=False,
+        help="Keep the generated episodes for later runs.",
+    ),
+)
+@cloup.option_group(
+    "Benchmark",
+    cloup.option(
+        "-m",
+        "--method",
+        type=cloup.Choice(list(PROBE_METHODS)),
+        multiple=True,
+        help="Native header parser, MediaInfo at one parse speed or the tiered "
+        "probe of uploads. [default: all]",
+    ),
+    cloup.option(
+        "-r",
+        "--repeat",
+        type=cloup.IntRange(min=1),
+        default=3,
+        show_default=True,
+        help="Runs per file and method, the fastest is reported.",
+    ),
+    cloup.option(
+        "--cold",
+        is_flag=True,
+        default=False,
+        help="Drop the file from the page cache before every run.",
+    ),
+    cloup.option(
+        "--json",
+        "json_path",
+        type=cloup.path(path_type=Path, dir_okay=False),
+        default=None,
+        help="Write results as JSON to FILE.",
+    ),
+)
+@cloup.pass_context
+def mediainfo(ctx, paths: tuple[Path, ...], **kwargs):
+    """Benchmark reading the tracks of episodes, natively and with MediaInfo"""
+    if any(x in sys.argv for x in ctx.help_option_names):
+        return
+
+    args = SimpleNamespace(**kwargs)
+    console = Console()
+    size = args.size * 1024 * 1024
+
+    directory = args.dir or Path(tempfile.mkdtemp(prefix="nyaaup-bench-"))
+    results = []
+    try:
+        files = list(paths)
+        if not files:
+            for kind in args.fixture or MEDIA_FIXTURES:
+                iprint(
+                    f"Creating {kind} episode ({humanize.naturalsize(size, True)})...", 0
+                )
+                files.append(create_media(directory, kind, size))
+
+        for path in files:
+            reference = reference_description(path)
+            if reference is None:
+                wprint(f"{path.name}: MediaInfo misses a field of the description.")
+
+            for method in args.method or PROBE_METHODS:
+                warm_up(method, path)
+                runs = []
+                for _ in range(args.repeat):
+                    if args.cold:
+                        drop_cache(path)
+                    runs.append(run_probe(method, path, reference))
+                best = min(runs, key=lambda x: x.seconds)
+                results.append(best)
+                console.print(
+                    f"[dim]{path.name:<28} {method:<7} {best.seconds * 1000:>9.1f} ms[/]"
+                )
+    finally:
+        if not paths and not args.keep:
+            if args.dir:
+                for kind in MEDIA_FIXTURES:
+                    for path in directory.glob(f"{kind}_{size}.*"):
+                        path.unlink()
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    table = Table(title="MediaInfo probing", title_style="bold")
+    for column in ("File", "Method", "Tier", "Time", "Read", "Matches"):
+        table.add_column(
+            column, justify="left" if column in ("File", "Method", "Tier") else "right"
+        )
+
+    for result in results:
+        table.add_row(
+            result.file,
+            result.method,
+            result.tier,
+            f"{result.seconds * 1000:.1f} ms",
+            humanize.naturalsize(result.bytes_read, True)
+            if result.bytes_read is not None
+            else "-",
+            {True: "[green]yes[/]", False: "[red]no[/]"}.get(result.matches, "missing"),
+        )
+    console.print()
+    console.print(table)
+
+    if args.json_path:
+        data = orjson.dumps(
+            {
+                **host_info(),
+                "cold": args.cold,
+                "results": [result.to_dict() for result in results],
+            },
+            option=orjson.OPT_INDENT_2,
+        )
+        args.json_path.write_bytes(data)
+        iprint(f"Results written to {args.json_path}", 1, 0)
@@ -1,4 +1,3 @@
-import asyncio
 import sys
 from pathlib import Path
 from types import SimpleNamespace
@@ -8,10 +7,8 @@ from rich import print as rich_print
 from rich.panel import Panel
 from rich.tree import Tree
 
-from nyaaup.utils.collections import first_or_none
-from nyaaup.utils.databases import process_anilist_info, process_mal_info
 from nyaaup.utils.logging import eprint, iprint, wprint
-from nyaaup.utils.upload import get_snapshot_tree
+from nyaaup.utils.torrent import TORRENT_VERSIONS
 from nyaaup.utils.uploader import Uploader
 
 
@@ -40,39 +37,15 @@ def _process_tags(uploader: Uploader, result, name_plus: list[str]) -> list[str]
     return name_plus
 
 
-def _process_database_info(
-    uploader: Uploader, name: str, display_info: Tree
-) -> list[str]:
-    """Process AniList/MAL information and return title additions."""
-    name_plus = []
-    if uploader.is_anime_category and not uploader.args.skip_database:
-        if not uploader.upload_config.info_form_config:
-            if uploader.upload_config.database == "myanimelist":
-                if mal_title := process_mal_info(uploader, name):
-                    name_plus.append(mal_title)
-                elif anilist_title := process_anilist_info(uploader, name):
-                    name_plus.append(anilist_title)
-            elif uploader.upload_config.database == "anilist":
-                if anilist_title := process_anilist_info(uploader, name):
-                    name_plus.append(anilist_title)
-                elif mal_title := process_mal_info(uploader, name):
-                    name_plus.append(mal_title)
-
-        if uploader.upload_config.info:
-            display_info.add(
-                f"[bold white]Database link: [cornflower_blue not bold]"
-                f"{uploader.upload_config.info}[white]"
-            )
-    return name_plus
-
-
-def _handle_watch_dir(uploader: Uploader, file_path: Path, display_info: Tree):
+def _handle_watch_dir(
+    uploader: Uploader, file_path: Path, display_info: Tree, provider=None
+):
     """Handle copying the file to the watch directory."""
     watch_dir = uploader.args.watch_dir or uploader.upload_config.watch_dir
     if watch_dir:
         try:
             watch_dir = Path(watch_dir)
-            if uploader.copy_to_watch_dir(file_path, watch_dir):
+            if uploader.copy_to_watch_dir(file_path, watch_dir, provider):
                 display_info.add(
                     "[bold white]Successfully copied to watch directory[white]"
                 )
@@ -82,6 +55,18 @@ def _handle_watch_dir(uploader: Uploader, file_path: Path, display_info: Tree):
             eprint(f"Failed to load watch directory: {e}")
 
 
+def _handle_torrent_client(
+    uploader: Uploader, file_path: Path, display_info: Tree, provider=None
+):
+    """Handle adding the torrent to qBittorrent."""
+    if uploader.upload_config.qbittorrent_url:
+        try:
+            if uploader.push_to_client(file_path, provider):
+                display_info.add("[bold white]Successfully added to qBittorrent[white]")
+        except Exception as e:
+            eprint(f"Failed to add torrent to qBittorrent: {e}")
+
+
 def _handle_post_upload(
     uploader: Uploader,
     upload_result,
@@ -97,11 +82,16 @@ def _handle_post_upload(
         except Exception as e:
             wprint(f"Failed to send notification: {e}")
 
-    _handle_watch_dir(uploader, file_path, display_info)
+    _handle_watch_dir(uploader, file_path, display_info, provider)
+    _handle_torrent_client(uploader, file_path, display_info, provider)
 
     display_info = uploader.display_success(display_info, upload_result, provider)
 
-    if uploader.check_cookies(provider) and uploader.upload_config.pic_num > 0:
+    if (
+        uploader.check_cookies(provider)
+        and uploader.upload_config.pic_num > 0
+        and not uploader.snapshots_added
+    ):
         display_info = uploader.handle_image_upload(
             upload_result, display_info, provider, duration
         )
@@ -282,6 +272,45 @@ def _handle_post_upload(
         default=True,
         help="Create torrent file even if exists. (Default: True)",
     ),
+    cloup.option(
+        "-tv",
+        "--torrent-version",
+        type=cloup.Choice(TORRENT_VERSIONS, case_sensitive=False),
+        default="1",
+        help=(
+            "BitTorrent version of the created torrent. 1-padded aligns every file "
+            "to a piece with BEP 47 pad files, so its hashes are cached per file and "
+            "reused in later batches. (Default: 1)"
+        ),
+    ),
+    cloup.option(
+        "-vf",
+        "--verify",
+        type=cloup.Choice(["off", "sample", "full"], case_sensitive=False),
+        default="sample",
+        help=(
+            "Check an existing torrent against the files before reusing it with "
+            "--no-overwrite: file list and a sample of pieces, or every piece. "
+            "(Default: sample)"
+        ),
+    ),
+    cloup.option(
+        "-bw",
+        "--bwlimit",
+        type=cloup.FloatRange(min=0),
+        default=None,
+        metavar="MB/s",
+        help="Limit hashing reads to MB/s, 0 for no limit. (Default: hash_bwlimit)",
+    ),
+    cloup.option(
+        "-id",
+        "--idle",
+        is_flag=True,
+        help=(
+            "Hash, and run ffmpeg and torrenttools, at idle CPU and I/O priority. "
+            "(Default: idle_priority)"
+        ),
+    ),
 )
 @cloup.option(
     "-ch",
@@ -304,12 +333,14 @@ def up(ctx, **kwargs):
         sys.exit(1)
 
     uploader = Uploader(ctx, SimpleNamespace(**kwargs))
+    uploader.prehash(list(uploader.args.path))
 
     for file_path in uploader.args.path:
         display_info = Tree("[bold white]Information[not bold]")
         uploader.description = ""
         uploader.file = ""
         uploader.mediainfo = []
+        uploader.snapshots_added = False
 
         name = uploader.get_file_name(file_path)
         style = "red"
@@ -317,42 +348,11 @@ def up(ctx, **kwargs):
 
         if result := uploader.process_file(file_path, display_info):
             display_info = result.display_info
-            name_plus = _process_database_info(uploader, name, display_info)
-            name_plus = _process_tags(uploader, result, name_plus)
-
-            if uploader.upload_config.pic_num > 0:
-                uploader.description += "\n\n---\n\n"
+            name_plus = _process_tags(uploader, result, result.name_plus)
 
             display_name = uploader.format_display_name(name, name_plus)
 
             for provider in uploader.providers:
-                video = first_or_none(
-                    [x for x in uploader.mediainfo if x["@type"] == "Video"]
-                )
-                duration = (
-                    float(video.get("Duration"))
-                    if video
-                    else float(uploader.mediainfo[0].get("Duration"))
-                )
-
-                if (
-                    uploader.upload_config.pic_num > 0
-                    and not uploader.check_cookies(provider)
-                    and not uploader.args.skip_upload
-                ):
-                    try:
-                        if images := asyncio.run(
-                            get_snapshot_tree(
-                                uploader=uploader,
-                                input_file=uploader.file,
-                                duration=duration,
-                            )
-                        ):
-                            display_info.add(images)
-                    except Exception as e:
-                        wprint(f"Failed to upload images: {e}")
-                        uploader.upload_config.pic_num = 0
-
                 iprint("Uploading to Nyaa...")
                 upload_result = uploader.try_upload_with_retries(
                     display_name, name, provider
@@ -363,7 +363,7 @@ def up(ctx, **kwargs):
                         uploader,
                         upload_result,
                         provider,
-                        duration,
+                        uploader.duration,
                         display_info,
                         file_path,
                     )
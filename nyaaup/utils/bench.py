@@ -0,0 +1,864 @@
+import copy
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from torf import Torrent
+
+from nyaaup.utils import which
+from nyaaup.utils.container import (
+    AUDIO,
+    CHANNELS,
+    CHAPTER_ATOM,
+    CHAPTERS,
+    CLUSTER,
+    CODEC_ID,
+    CODEC_PRIVATE,
+    DEFAULT_DURATION,
+    DURATION,
+    EBML,
+    EDITION_ENTRY,
+    INFO,
+    LANGUAGE,
+    NAME,
+    PIXEL_HEIGHT,
+    PIXEL_WIDTH,
+    SEEK,
+    SEEK_HEAD,
+    SEEK_ID,
+    SEEK_POSITION,
+    SEGMENT,
+    SIMPLE_TAG,
+    TAG,
+    TAG_NAME,
+    TAG_STRING,
+    TAG_TRACK_UID,
+    TAGS,
+    TARGETS,
+    TIMESTAMP_SCALE,
+    TRACK_ENTRY,
+    TRACK_TYPE,
+    TRACK_UID,
+    TRACKS,
+    VIDEO,
+    read_tracks,
+)
+from nyaaup.utils.hasher import PieceHasher, ReadOptions
+from nyaaup.utils.mediainfo import (
+    fill_missing,
+    get_description,
+    get_mediainfo,
+    parse_mediainfo,
+)
+
+DATASETS = ("single", "multi")
+CHUNK_SIZE = 8 * 1024 * 1024  # 8 MiB
+MEDIA_FIXTURES = ("mkv", "mkv-nostats", "mp4")
+# Ways to get the tracks: the native header parser, MediaInfo at one parse speed
+# and the tiered probe of uploads
+PROBE_METHODS = {
+    "native": None,
+    "header": 0.0,
+    "sample": 0.5,
+    "full": 1.0,
+    "tiered": None,
+}
+# Bitrate of the fixture tracks, the duration follows from the fixture size
+VIDEO_BITRATE = 8_000_000
+AAC_BITRATE = 128_000
+AC3_BITRATE = 448_000
+# avcC of a 1080p AVC High@L4.1 stream
+AVC_CONFIG = bytes.fromhex(
+    "01640029ffe1001867640029acd940780227e58400000fa40002ee003c60c65801000468ef8fcb"
+)
+
+
+@dataclass
+class BenchResult:
+    dataset: str
+    backend: str
+    piece_size: int
+    size: int
+    seconds: float
+    cpu_seconds: float
+    # Memory the run needed at its peak: the RSS over the benchmark process
+    # before the run for torf and native, the RSS of the process for torrenttools
+    peak_rss: int | None
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.size / 1_000_000 / self.seconds if self.seconds else 0.0
+
+    @property
+    def cpu_percent(self) -> float:
+        """CPU time as a percentage of one core, like `time` reports it."""
+        return self.cpu_seconds / self.seconds * 100 if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "mb_per_s": round(self.mb_per_s, 2),
+            "cpu_percent": round(self.cpu_percent, 1),
+        }
+
+
+@dataclass
+class ProbeResult:
+    file: str
+    method: str
+    size: int
+    seconds: float
+    bytes_read: int | None
+    tier: str
+    # Whether the description is the one of a full MediaInfo parse, None if
+    # a field of it is missing
+    matches: bool | None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def host_info() -> dict:
+    return {
+        "host": platform.node(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+    }
+
+
+def create_dataset(directory: Path, kind: str, size: int, files: int = 24) -> Path:
+    """
+    Create (or reuse) a synthetic dataset of random data of `size` bytes.
+
+    `single` is one file, `multi` is a folder of `files` equally sized files
+    like an episode batch.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if kind == "single":
+        path = directory / f"single_{size}.bin"
+        _write_random(path, size)
+        return path
+
+    path = directory / f"multi_{size}_{files}"
+    path.mkdir(exist_ok=True)
+    for num in range(files):
+        part = size // files + (1 if num < size % files else 0)
+        _write_random(path / f"episode_{num + 1:03}.bin", part)
+
+    return path
+
+
+def _write_random(path: Path, size: int) -> None:
+    if path.is_file() and path.stat().st_size == size:
+        return
+
+    with path.open("wb") as f:
+        remaining = size
+        while remaining:
+            chunk = min(CHUNK_SIZE, remaining)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+
+@dataclass
+class _FixtureTrack:
+    kind: str
+    format: str
+    timescale: int
+    # Duration of every frame in `timescale` units
+    delta: int
+    count: int
+    frame: bytes
+    config: bytes = b""
+    channels: int = 0
+    language: str | None = None
+    title: str | None = None
+
+    def frames(self, second: int) -> range:
+        """Numbers of the frames that start within `second`."""
+        first = -(-second * self.timescale // self.delta)
+        last = -(-(second + 1) * self.timescale // self.delta)
+        return range(min(first, self.count), min(last, self.count))
+
+    @property
+    def duration(self) -> float:
+        return self.count * self.delta / self.timescale
+
+
+def create_media(directory: Path, kind: str, size: int) -> Path:
+    """
+    Create (or reuse) a synthetic episode of about `size` bytes: 1080p AVC, AAC 2.0
+    in Japanese, AC-3 5.1 in English titled Dub and English subtitles.
+
+    `mkv` has chapters and mkvmerge's statistics tags after the clusters,
+    `mkv-nostats` lacks the tags, so the bitrates are only known from reading
+    every block. `mp4` has its movie box after the media data, like ffmpeg writes
+    it. The headers are real, the frames are filler of the right size.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{kind}_{size}.{kind[:3]}"
+    if path.is_file():
+        return path
+
+    seconds = max(1, size * 8 // (VIDEO_BITRATE + AAC_BITRATE + AC3_BITRATE))
+    video_frame = VIDEO_BITRATE * 1001 // 8 // 24000
+    tracks = [
+        _FixtureTrack(
+            "video",
+            "AVC",
+            24000,
+            1001,
+            seconds * 24000 // 1001,
+            # A filler data NAL unit
+            (video_frame - 4).to_bytes(4, "big")
+            + b"\x0c"
+            + b"\xff" * (video_frame - 6)
+            + b"\x80",
+            AVC_CONFIG,
+        ),
+        _FixtureTrack(
+            "audio",
+            "AAC",
+            48000,
+            1024,
+            seconds * 48000 // 1024,
+            # A silent stereo frame, the rest is padding after its end element
+            b"\x21\x00\x49\x90\x02\x19\x00\x23\x80".ljust(
+                AAC_BITRATE * 1024 // 8 // 48000, b"\0"
+            ),
+            # AAC LC, 48 kHz, 2 channels
+            b"\x11\x90",
+            channels=2,
+            language="jpn",
+        ),
+        _FixtureTrack(
+            "audio",
+            "AC-3",
+            48000,
+            1536,
+            seconds * 48000 // 1536,
+            _ac3_frame(AC3_BITRATE * 1536 // 8 // 48000),
+            channels=6,
+            language="eng",
+            title="Dub",
+        ),
+        _FixtureTrack(
+            "text",
+            "UTF-8",
+            1000,
+            60000,
+            max(1, seconds // 60),
+            b"Subtitle line",
+            # Matroska tracks without a language element are English
+            language=None if kind.startswith("mkv") else "eng",
+        ),
+    ]
+
+    tmp = path.with_name(f"{path.name}.tmp")
+    with tmp.open("wb") as f:
+        if kind == "mp4":
+            _write_mp4(f, tracks, seconds)
+        else:
+            _write_matroska(f, tracks, seconds, statistics=kind == "mkv")
+    tmp.replace(path)
+
+    return path
+
+
+def _ac3_frame(size: int) -> bytes:
+    """A silent AC-3 frame of `size` bytes: 48 kHz, 3/2 channels with LFE."""
+    frame = bytearray(b"\x0b\x77\0\0\x1e\x40\xe1".ljust(size, b"\0"))
+
+    # crc1 makes the CRC of the first 5/8 of the frame after the sync word zero.
+    # The CRC is linear, so flip crc1 bits in Gray code order until it is.
+    words = size // 2
+    end = ((words >> 1) + (words >> 3)) * 2
+    target = _crc16(frame[2:end])
+    columns = [
+        _crc16((1 << bit).to_bytes(2, "big") + bytes(end - 4)) for bit in range(16)
+    ]
+    crc = value = 0
+    for step in range(1, 1 << 16):
+        bit = (step & -step).bit_length() - 1
+        crc ^= 1 << bit
+        value ^= columns[bit]
+        if value == target:
+            break
+    frame[2:4] = crc.to_bytes(2, "big")
+
+    return bytes(frame)
+
+
+def _crc16(data: bytes) -> int:
+    """CRC-16 of AC-3, polynomial 0x8005."""
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = (crc << 1 ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xFFFF
+
+    return crc
+
+
+def _ebml(element_id: int, value: bytes | str | int | float | list[bytes]) -> bytes:
+    if isinstance(value, list):
+        value = b"".join(value)
+    elif isinstance(value, str):
+        value = value.encode()
+    elif isinstance(value, float):
+        value = struct.pack(">d", value)
+    elif isinstance(value, int):
+        value = value.to_bytes(max(1, -(-value.bit_length() // 8)), "big")
+
+    # Every size is written with 8 bytes, so elements can be patched in place
+    return (
+        element_id.to_bytes(-(-element_id.bit_length() // 8), "big")
+        + (1 << 56 | len(value)).to_bytes(8, "big")
+        + value
+    )
+
+
+def _duration_tag(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+
+    return f"{hours:02}:{minutes:02}:{seconds:012.9f}"
+
+
+def _write_matroska(
+    f: BinaryIO, tracks: list[_FixtureTrack], seconds: int, statistics: bool
+) -> None:
+    codecs = {"AVC": "V_MPEG4/ISO/AVC", "AAC": "A_AAC", "AC-3": "A_AC3"}
+    codecs["UTF-8"] = "S_TEXT/UTF8"
+    kinds = {"video": 1, "audio": 2, "text": 17}
+
+    def entry(num: int, track: _FixtureTrack) -> bytes:
+        values = [
+            _ebml(0xD7, num),  # TrackNumber
+            _ebml(TRACK_UID, num),
+            _ebml(TRACK_TYPE, kinds[track.kind]),
+            _ebml(CODEC_ID, codecs[track.format]),
+        ]
+        if track.config:
+            values.append(_ebml(CODEC_PRIVATE, track.config))
+        if track.language:
+            values.append(_ebml(LANGUAGE, track.language))
+        if track.title:
+            values.append(_ebml(NAME, track.title))
+        if track.kind == "video":
+            values += [
+                _ebml(DEFAULT_DURATION, track.delta * 1_000_000_000 // track.timescale),
+                _ebml(VIDEO, [_ebml(PIXEL_WIDTH, 1920), _ebml(PIXEL_HEIGHT, 1080)]),
+            ]
+        elif track.kind == "audio":
+            values.append(
+                _ebml(
+                    AUDIO,
+                    [
+                        _ebml(0xB5, float(track.timescale)),
+                        _ebml(CHANNELS, track.channels),
+                    ],
+                )
+            )
+        return _ebml(TRACK_ENTRY, values)
+
+    def tag(num: int, track: _FixtureTrack) -> bytes:
+        size = track.count * len(track.frame)
+        values = {
+            "BPS": str(round(size * 8 / track.duration)),
+            "DURATION": _duration_tag(track.duration),
+            "NUMBER_OF_FRAMES": str(track.count),
+            "NUMBER_OF_BYTES": str(size),
+            "_STATISTICS_WRITING_APP": "nyaaup",
+            "_STATISTICS_TAGS": "BPS DURATION NUMBER_OF_FRAMES NUMBER_OF_BYTES",
+        }
+        return _ebml(
+            TAG,
+            [
+                # TargetTypeValue
+                _ebml(TARGETS, [_ebml(0x68CA, 50), _ebml(TAG_TRACK_UID, num)]),
+                *(
+                    _ebml(SIMPLE_TAG, [_ebml(TAG_NAME, name), _ebml(TAG_STRING, value)])
+                    for name, value in values.items()
+                ),
+            ],
+        )
+
+    def seek_head(positions: dict[int, int]) -> bytes:
+        return _ebml(
+            SEEK_HEAD,
+            [
+                _ebml(
+                    SEEK,
+                    [
+                        _ebml(SEEK_ID, element_id.to_bytes(4, "big")),
+                        _ebml(SEEK_POSITION, position.to_bytes(8, "big")),
+                    ],
+                )
+                for element_id, position in positions.items()
+            ],
+        )
+
+    chapters = [
+        _ebml(
+            CHAPTER_ATOM,
+            [
+                _ebml(0x73C4, num + 1),  # ChapterUID
+                _ebml(0x91, start * 1_000_000_000),  # ChapterTimeStart
+                # ChapterDisplay, ChapString and ChapLanguage
+                _ebml(0x80, [_ebml(0x85, name), _ebml(0x437C, "eng")]),
+            ],
+        )
+        for num, (start, name) in enumerate(((0, "Episode"), (seconds // 2, "Part B")))
+    ]
+    head = {
+        INFO: _ebml(
+            INFO,
+            [
+                _ebml(TIMESTAMP_SCALE, 1_000_000),
+                _ebml(DURATION, seconds * 1000.0),
+                _ebml(0x4D80, "nyaaup"),  # MuxingApp
+                _ebml(0x5741, "nyaaup"),  # WritingApp
+            ],
+        ),
+        TRACKS: _ebml(TRACKS, [entry(num, x) for num, x in enumerate(tracks, 1)]),
+        CHAPTERS: _ebml(CHAPTERS, [_ebml(EDITION_ENTRY, chapters)]),
+    }
+    positions = dict.fromkeys([*head, *([TAGS] if statistics else [])], 0)
+
+    f.write(
+        _ebml(
+            EBML,
+            [
+                _ebml(0x4286, 1),  # EBMLVersion
+                _ebml(0x42F7, 1),  # EBMLReadVersion
+                _ebml(0x42F2, 4),  # EBMLMaxIDLength
+                _ebml(0x42F3, 8),  # EBMLMaxSizeLength
+                _ebml(0x4282, "matroska"),  # DocType
+                _ebml(0x4287, 4),  # DocTypeVersion
+                _ebml(0x4285, 2),  # DocTypeReadVersion
+            ],
+        )
+    )
+    f.write(SEGMENT.to_bytes(4, "big") + bytes(8))
+    segment = f.tell()
+    f.write(seek_head(positions))
+    for element_id, element in head.items():
+        positions[element_id] = f.tell() - segment
+        f.write(element)
+
+    for second in range(seconds):
+        blocks = []
+        for num, track in enumerate(tracks, 1):
+            for frame in track.frames(second):
+                timestamp = frame * track.delta * 1000 // track.timescale
+                header = bytes([0x80 | num]) + (timestamp - second * 1000).to_bytes(
+                    2, "big", signed=True
+                )
+                if track.kind == "text":
+                    # BlockGroup with a Block and its BlockDuration
+                    block = _ebml(
+                        0xA0,
+                        [
+                            _ebml(0xA1, header + b"\0" + track.frame),
+                            _ebml(0x9B, track.delta * 1000 // track.timescale),
+                        ],
+                    )
+                else:
+                    # SimpleBlock of a keyframe
+                    block = _ebml(0xA3, header + b"\x80" + track.frame)
+                blocks.append((timestamp, num, block))
+        # Cluster with its Timestamp
+        cluster = [_ebml(0xE7, second * 1000), *(x for *_, x in sorted(blocks))]
+        f.write(_ebml(CLUSTER, cluster))
+
+    if statistics:
+        positions[TAGS] = f.tell() - segment
+        f.write(_ebml(TAGS, [tag(num, x) for num, x in enumerate(tracks, 1)]))
+
+    end = f.tell()
+    f.seek(segment - 8)
+    f.write((1 << 56 | end - segment).to_bytes(8, "big"))
+    f.write(seek_head(positions))
+
+
+def _mp4_box(kind: bytes, *payload: bytes) -> bytes:
+    data = b"".join(payload)
+
+    return struct.pack(">I4s", 8 + len(data), kind) + data
+
+
+def _write_mp4(f: BinaryIO, tracks: list[_FixtureTrack], seconds: int) -> None:
+    f.write(_mp4_box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41"))
+    mdat = f.tell()
+    f.write(struct.pack(">I4sQ", 1, b"mdat", 0))
+
+    # Offset and number of frames of every chunk, one per track and second
+    chunks: list[list[tuple[int, int]]] = [[] for _ in tracks]
+    for second in range(seconds):
+        for track, track_chunks in zip(tracks, chunks, strict=True):
+            if frames := track.frames(second):
+                track_chunks.append((f.tell(), len(frames)))
+                for _ in frames:
+                    f.write(track.frame)
+
+    end = f.tell()
+    f.seek(mdat + 8)
+    f.write(struct.pack(">Q", end - mdat))
+    f.seek(end)
+
+    matrix = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    traks = [
+        _mp4_trak(num, track, track_chunks, matrix)
+        for num, (track, track_chunks) in enumerate(zip(tracks, chunks, strict=True), 1)
+    ]
+    duration = round(max(x.duration for x in tracks) * 1000)
+    mvhd = struct.pack(">IIIIIIH10x", 0, 0, 0, 1000, duration, 0x10000, 0x100)
+    f.write(
+        _mp4_box(
+            b"moov",
+            _mp4_box(
+                b"mvhd", mvhd, matrix, bytes(24), struct.pack(">I", len(tracks) + 1)
+            ),
+            *traks,
+        )
+    )
+
+
+def _mp4_trak(
+    num: int, track: _FixtureTrack, chunks: list[tuple[int, int]], matrix: bytes
+) -> bytes:
+    duration = track.count * track.delta
+    language = sum(
+        (ord(char) - 0x60) << shift
+        for char, shift in zip(track.language or "und", (10, 5, 0), strict=True)
+    )
+    video = track.kind == "video"
+    # ffmpeg's handler names, MediaInfo shows other names as the track title
+    handler, name = {
+        "video": (b"vide", b"VideoHandler"),
+        "audio": (b"soun", b"SoundHandler"),
+        "text": (b"sbtl", b"SubtitleHandler"),
+    }[track.kind]
+
+    if video:
+        header = _mp4_box(b"vmhd", struct.pack(">I8x", 1))
+        entry = _mp4_box(
+            b"avc1",
+            struct.pack(
+                ">6xH16xHHIIIH32xHh", 1, 1920, 1080, 0x480000, 0x480000, 0, 1, 24, -1
+            ),
+            _mp4_box(b"avcC", track.config),
+        )
+    elif track.kind == "audio":
+        header = _mp4_box(b"smhd", bytes(8))
+        fields = struct.pack(
+            ">6xH8xHHHHI", 1, track.channels, 16, 0, 0, track.timescale << 16
+        )
+        if track.format == "AAC":
+            bitrate = struct.pack(">II", AAC_BITRATE, AAC_BITRATE)
+            decoder = b"\x04\x11\x40\x15\0\0\0" + bitrate + b"\x05\x02" + track.config
+            descriptor = b"\0\x01\0" + decoder + b"\x06\x01\x02"
+            config = _mp4_box(
+                b"esds", bytes(4), bytes([0x03, len(descriptor)]), descriptor
+            )
+            entry = _mp4_box(b"mp4a", fields, config)
+        else:
+            # fscod 48 kHz, bsid 8, bsmod 0, acmod 3/2, LFE, 448 kbps
+            dac3 = (8 << 17 | 7 << 11 | 1 << 10 | 15 << 5).to_bytes(3, "big")
+            entry = _mp4_box(b"ac-3", fields, _mp4_box(b"dac3", dac3))
+    else:
+        header = _mp4_box(b"nmhd", bytes(4))
+        # Display flags, justification, colours, default text box and style
+        entry = _mp4_box(
+            b"tx3g",
+            struct.pack(
+                ">6xHIbb4x8xHHHBB4B", 1, 0, 1, -1, 0, 0, 1, 0, 18, 255, 255, 255, 255
+            ),
+            _mp4_box(b"ftab", struct.pack(">HHB", 1, 1, 5), b"Serif"),
+        )
+
+    stsc = [
+        (index, frames, 1)
+        for index, (_, frames) in enumerate(chunks, 1)
+        if index == 1 or frames != chunks[index - 2][1]
+    ]
+    stbl = _mp4_box(
+        b"stbl",
+        _mp4_box(b"stsd", struct.pack(">II", 0, 1), entry),
+        _mp4_box(b"stts", struct.pack(">IIII", 0, 1, track.count, track.delta)),
+        _mp4_box(
+            b"stsc",
+            struct.pack(">II", 0, len(stsc)),
+            *(struct.pack(">III", *x) for x in stsc),
+        ),
+        _mp4_box(b"stsz", struct.pack(">III", 0, len(track.frame), track.count)),
+        _mp4_box(
+            b"co64",
+            struct.pack(">II", 0, len(chunks)),
+            *(struct.pack(">Q", offset) for offset, _ in chunks),
+        ),
+    )
+    dinf = _mp4_box(
+        b"dinf",
+        _mp4_box(b"dref", struct.pack(">II", 0, 1), _mp4_box(b"url ", b"\0\0\0\x01")),
+    )
+    mdia = _mp4_box(
+        b"mdia",
+        _mp4_box(
+            b"mdhd",
+            struct.pack(">IIIIIHH", 0, 0, 0, track.timescale, duration, language, 0),
+        ),
+        _mp4_box(b"hdlr", struct.pack(">II4s12x", 0, 0, handler), name, b"\0"),
+        _mp4_box(b"minf", header, dinf, stbl),
+    )
+    tkhd = struct.pack(
+        ">IIIIII8xHHH2x",
+        3,
+        0,
+        0,
+        num,
+        0,
+        duration * 1000 // track.timescale,
+        0,
+        0,
+        0x100 if track.kind == "audio" else 0,
+    )
+    size = struct.pack(">II", 1920 << 16, 1080 << 16) if video else bytes(8)
+    udta = (
+        [_mp4_box(b"udta", _mp4_box(b"name", track.title.encode()))]
+        if track.title
+        else []
+    )
+
+    return _mp4_box(b"trak", _mp4_box(b"tkhd", tkhd, matrix, size), mdia, *udta)
+
+
+def drop_cache(path: Path) -> None:
+    """Evict `path` from the page cache, so the next run reads from disk."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    for file in [path] if path.is_file() else sorted(path.rglob("*")):
+        if file.is_file():
+            fd = os.open(file, os.O_RDONLY)
+            try:
+                os.fdatasync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def _bytes_read() -> int | None:
+    """Bytes this process has read so far, page cache hits included."""
+    with suppress(OSError, ValueError, StopIteration), Path("/proc/self/io").open() as f:
+        return next(int(x.split()[1]) for x in f if x.startswith("rchar:"))
+
+    return None
+
+
+def warm_up(method: str, path: Path) -> None:
+    """
+    Parse `path` once with the MediaInfo parse speed of `method`. MediaInfo
+    (24.12) reads the frames of an MP4 as far as the parse speed of the parse
+    before it, a full parse after a partial one stops after about 41 MiB.
+    """
+    if (speed := PROBE_METHODS.get(method)) is not None:
+        get_mediainfo(path, speed)
+
+
+def reference_description(path: Path) -> tuple | None:
+    """The description of a full MediaInfo parse, what every method should get."""
+    warm_up("full", path)
+
+    return probe_description(get_mediainfo(path, 1.0).tracks)
+
+
+def probe_description(tracks: list[dict[str, str | int]]) -> tuple | None:
+    """What the upload description shows of `tracks`, None if a field is missing."""
+    tracks = copy.deepcopy(tracks)
+    if not tracks or fill_missing(tracks):
+        return None
+    general = tracks[0]
+
+    return (
+        general.get("Duration_String3"),
+        bool(general.get("MenuCount")),
+        get_description(tracks),
+    )
+
+
+def run_probe(method: str, path: Path, reference: tuple | None) -> ProbeResult:
+    """Get the tracks of `path` once with `method`, measure time and bytes read."""
+    read = _bytes_read()
+    start = time.perf_counter()
+
+    if method == "native":
+        tracks = read_tracks(path) or []
+        tier = "native"
+    elif method == "tiered":
+        result = parse_mediainfo(path, text=False)
+        tracks, tier = result.tracks, result.tier
+    else:
+        tracks = get_mediainfo(path, PROBE_METHODS[method]).tracks
+        tier = method
+
+    seconds = time.perf_counter() - start
+    bytes_read = None if read is None else (_bytes_read() or read) - read
+    description = probe_description(tracks)
+
+    return ProbeResult(
+        file=path.name,
+        method=method,
+        size=path.stat().st_size,
+        seconds=seconds,
+        bytes_read=bytes_read,
+        tier=tier if tracks else "-",
+        matches=None if description is None else description == reference,
+    )
+
+
+def _dataset_files(path: Path) -> list[tuple[Path, int]]:
+    if path.is_file():
+        return [(path, path.stat().st_size)]
+
+    return [(x, x.stat().st_size) for x in sorted(path.iterdir()) if x.is_file()]
+
+
+class _RssSampler(threading.Thread):
+    """
+    Track the peak resident set size of this process while running, over the
+    RSS before it started. The interpreter, rich and the dataset are not
+    counted, like for a backend that runs in its own process.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.baseline = self.rss()
+        self.peak: int | None = None
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def rss() -> int | None:
+        try:
+            with Path("/proc/self/statm").open() as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            if (rss := self.rss()) is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> int | None:
+        self._stop_event.set()
+        self.join()
+        if (rss := self.rss()) is not None:
+            self.peak = max(self.peak or 0, rss)
+        if self.peak is None or self.baseline is None:
+            return None
+
+        return max(0, self.peak - self.baseline)
+
+
+def run_backend(
+    backend: str,
+    dataset: str,
+    path: Path,
+    piece_size: int,
+    threads: int | None = None,
+    options: ReadOptions | None = None,
+) -> BenchResult:
+    """Hash `path` once with `backend` and measure time, CPU and memory."""
+    files = _dataset_files(path)
+    size = sum(x for _, x in files)
+
+    if backend == "torrenttools":
+        seconds, cpu_seconds, peak_rss = _run_torrenttools(path, piece_size, threads)
+    else:
+        sampler = _RssSampler()
+        sampler.start()
+        start, cpu_start = time.perf_counter(), time.process_time()
+
+        if backend == "torf":
+            torrent = Torrent(
+                path, piece_size=piece_size, creation_date=None, created_by=None
+            )
+            torrent.generate(threads=threads)
+        elif backend == "native":
+            PieceHasher(files, piece_size, threads=threads, options=options).hash()
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        peak_rss = sampler.stop()
+
+    return BenchResult(
+        dataset=dataset,
+        backend=backend,
+        piece_size=piece_size,
+        size=size,
+        seconds=seconds,
+        cpu_seconds=cpu_seconds,
+        peak_rss=peak_rss,
+    )
+
+
+def _run_torrenttools(
+    path: Path, piece_size: int, threads: int | None
+) -> tuple[float, float, int | None]:
+    if not (executable := which("torrenttools")):
+        raise FileNotFoundError("torrenttools not found")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        command = [
+            str(executable),
+            "create",
+            str(path),
+            "--no-created-by",
+            "--no-creation-date",
+            "--piece-size",
+            f"{piece_size // 1024}K",
+            "--output",
+            str(Path(tmp) / "bench.torrent"),
+            *(["--threads", str(threads)] if threads else []),
+        ]
+
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            seconds = time.perf_counter() - start
+            cpu_seconds = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        else:
+            process.wait()
+            seconds = time.perf_counter() - start
+            cpu_seconds, peak_rss = 0.0, None
+
+        if process.returncode:
+            stderr = process.stderr.read().decode() if process.stderr else ""
+            raise RuntimeError(f"torrenttools failed: {stderr.strip()}")
+
+    return seconds, cpu_seconds, peak_rss
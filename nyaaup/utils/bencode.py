@@ -0,0 +1,79 @@
+from typing import Any
+
+
+def bencode(value: Any) -> bytes:
+    """Encode `value` (bytes, str, int, list or dict) as bencode."""
+    out: list[bytes] = []
+    _encode(value, out)
+
+    return b"".join(out)
+
+
+def _encode(value: Any, out: list[bytes]) -> None:
+    if isinstance(value, bool):
+        value = int(value)
+
+    if isinstance(value, int):
+        out.append(b"i%de" % value)
+    elif isinstance(value, bytes | bytearray):
+        out.append(b"%d:" % len(value))
+        out.append(bytes(value))
+    elif isinstance(value, str):
+        _encode(value.encode(), out)
+    elif isinstance(value, list | tuple):
+        out.append(b"l")
+        for item in value:
+            _encode(item, out)
+        out.append(b"e")
+    elif isinstance(value, dict):
+        out.append(b"d")
+        items = ((k.encode() if isinstance(k, str) else k, v) for k, v in value.items())
+        for key, item in sorted(items):
+            _encode(key, out)
+            _encode(item, out)
+        out.append(b"e")
+    else:
+        raise TypeError(f"Cannot bencode {type(value).__name__}: {value!r}")
+
+
+def bdecode(data: bytes) -> Any:
+    """Decode bencoded `data`; strings are returned as bytes."""
+    value, end = _decode(data, 0)
+    if end != len(data):
+        raise ValueError("Trailing data after bencoded value")
+
+    return value
+
+
+def _decode(data: bytes, pos: int) -> tuple[Any, int]:
+    token = data[pos : pos + 1]
+
+    if token == b"i":
+        end = data.index(b"e", pos)
+        return int(data[pos + 1 : end]), end + 1
+
+    if token == b"l":
+        items = []
+        pos += 1
+        while data[pos : pos + 1] != b"e":
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos + 1
+
+    if token == b"d":
+        result = {}
+        pos += 1
+        while data[pos : pos + 1] != b"e":
+            key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos + 1
+
+    if token.isdigit():
+        colon = data.index(b":", pos)
+        start = colon + 1
+        end = start + int(data[pos:colon])
+        if end > len(data):
+            raise ValueError("Truncated bencoded string")
+        return data[start:end], end
+
+    raise ValueError(f"Invalid bencode token at {pos}: {token!r}")
@@ -0,0 +1,103 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any
+
+import orjson
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024  # 100 MiB
+
+
+class DiskCache:
+    """Size-bounded SQLite key/value store with least-recently-used eviction."""
+
+    def __init__(self, path: Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS accessed ON entries (accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per operation keeps the cache usable from worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> bytes | None:
+        """Return the value stored under `key` and mark it as recently used."""
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+
+        return row[0]
+
+    def contains(self, keys: list[str]) -> set[str]:
+        """Return which of `keys` are stored, without marking them as used."""
+        found: set[str] = set()
+        with closing(self._connect()) as db:
+            # Stay below SQLite's limit of bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                found.update(
+                    key
+                    for (key,) in db.execute(
+                        "SELECT key FROM entries WHERE key IN "
+                        f"({', '.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store `value` under `key`, evicting old entries above `max_size`."""
+        if len(value) > self.max_size:
+            return
+
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict(db)
+
+    def delete(self, *keys: str) -> None:
+        with closing(self._connect()) as db, db:
+            db.executemany("DELETE FROM entries WHERE key = ?", [(x,) for x in keys])
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_size:
+            return
+
+        for key, size in db.execute(
+            "SELECT key, size FROM entries ORDER BY accessed"
+        ).fetchall():
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_size:
+                break
+
+
+def pack(header: dict[str, Any], payload: bytes = b"") -> bytes:
+    """Serialize a JSON `header` followed by a binary `payload`."""
+    data = orjson.dumps(header)
+
+    return len(data).to_bytes(4, "big") + data + payload
+
+
+def unpack(value: bytes) -> tuple[dict[str, Any], bytes]:
+    size = int.from_bytes(value[:4], "big")
+
+    return orjson.loads(value[4 : 4 + size]), value[4 + size :]
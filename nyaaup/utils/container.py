@@ -0,0 +1,649 @@
+import contextlib
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from langcodes import standardize_tag
+
+# First read of a file, holds the Matroska header elements of most muxers
+HEAD_SIZE = 64 * 1024
+# Largest header element or MP4 moov box that is read, bigger ones are left to
+# MediaInfo
+MAX_ELEMENT_SIZE = 32 * 1024 * 1024
+
+Track = dict[str, str | int]
+
+# Matroska element ids
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+DEFAULT_DURATION = 0x23E383
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+CHANNELS = 0x9F
+CHAPTERS = 0x1043A770
+EDITION_ENTRY = 0x45B9
+CHAPTER_ATOM = 0xB6
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TAG_TRACK_UID = 0x63C5
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_STRING = 0x4487
+CLUSTER = 0x1F43B675
+
+MASTER_ELEMENTS = {
+    INFO,
+    TRACKS,
+    TRACK_ENTRY,
+    VIDEO,
+    AUDIO,
+    CHAPTERS,
+    EDITION_ENTRY,
+    TAGS,
+    TAG,
+    TARGETS,
+    SIMPLE_TAG,
+    SEEK_HEAD,
+    SEEK,
+}
+STRING_ELEMENTS = {CODEC_ID, NAME, LANGUAGE, LANGUAGE_BCP47, TAG_NAME, TAG_STRING}
+BINARY_ELEMENTS = {CODEC_PRIVATE, SEEK_ID}
+FLOAT_ELEMENTS = {DURATION}
+
+# Codecs whose description fields are all in the header, with MediaInfo's
+# Format. E-AC-3 and TrueHD are missing: Atmos is only in their bitstream.
+MKV_VIDEO = {"V_MPEG4/ISO/AVC": "AVC", "V_MPEGH/ISO/HEVC": "HEVC"}
+MKV_AUDIO = {"A_AAC": "AAC", "A_AC3": "AC-3", "A_FLAC": "FLAC", "A_OPUS": "Opus"}
+MKV_TEXT = {
+    "S_TEXT/UTF8": "UTF-8",
+    "S_TEXT/ASS": "ASS",
+    "S_TEXT/SSA": "SSA",
+    "S_HDMV/PGS": "PGS",
+    "S_VOBSUB": "VobSub",
+}
+MP4_VIDEO = {b"avc1": "AVC", b"avc3": "AVC", b"hvc1": "HEVC", b"hev1": "HEVC"}
+MP4_AUDIO = {b"mp4a": "AAC", b"ac-3": "AC-3", b"fLaC": "FLAC", b"Opus": "Opus"}
+MP4_TEXT = {b"tx3g": "Timed Text"}
+INTERNET_MEDIA_TYPES = {"AVC": "video/H264", "HEVC": "video/H265"}
+
+AVC_PROFILES = {
+    66: "Baseline",
+    77: "Main",
+    88: "Extended",
+    100: "High",
+    110: "High 10",
+    122: "High 4:2:2",
+    244: "High 4:4:4 Predictive",
+}
+HEVC_PROFILES = {1: "Main", 2: "Main 10", 3: "Main Still"}
+AC3_CHANNELS = (2, 1, 2, 3, 3, 4, 4, 5)
+
+
+class Unsupported(Exception):
+    """The header does not have every field the description needs."""
+
+
+def read_tracks(file_path: Path) -> list[Track] | None:
+    """
+    Read the tracks of a Matroska or MP4 file from its headers, in the shape of
+    MediaInfo's JSON report. Only the header elements are read, a few small reads
+    whatever the file size.
+
+    Return None if the file is neither, or if a field of the description is not
+    in the header, MediaInfo has to parse the file then.
+    """
+    try:
+        with file_path.open("rb") as file:
+            head = file.read(HEAD_SIZE)
+            size = file_path.stat().st_size
+            if head.startswith(b"\x1a\x45\xdf\xa3"):
+                return _read_matroska(file, head, size)
+            if head[4:8] == b"ftyp":
+                return _read_mp4(file, size)
+    except (
+        Unsupported,
+        OSError,
+        ValueError,
+        KeyError,
+        IndexError,
+        TypeError,
+        struct.error,
+    ):
+        pass
+
+    return None
+
+
+def _general(size: int, duration: float, chapters: bool) -> Track:
+    general: Track = {
+        "@type": "General",
+        "FileSize": str(size),
+        "Duration": f"{duration:.3f}",
+        "Duration_String3": _duration_string(duration),
+    }
+    if chapters:
+        general["MenuCount"] = "1"
+
+    return general
+
+
+def _duration_string(seconds: float) -> str:
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+
+    return f"{hours:02}:{minutes:02}:{millis // 1000:02}.{millis % 1000:03}"
+
+
+def _frame_rate_string(fps: float) -> str:
+    # NTSC rates are shown with their fraction, like 23.976 (24000/1001) FPS
+    ntsc = round(fps * 1.001)
+    if abs(fps - ntsc / 1.001) < 0.0005 and abs(fps - round(fps)) > 0.0005:
+        return f"{fps:.3f} ({ntsc * 1000}/1001) FPS"
+
+    return f"{fps:.3f} FPS"
+
+
+def _language(code: str) -> str | None:
+    """MediaInfo's form of a language tag: the shortest code, None if undefined."""
+    if not code or code == "und":
+        return None
+    with contextlib.suppress(ValueError):
+        return standardize_tag(code)
+
+    return code
+
+
+def _video_profile(format_: str, config: bytes) -> tuple[str, str]:
+    """Profile and level of an avcC or hvcC decoder configuration."""
+    if format_ == "AVC":
+        profile = AVC_PROFILES[config[1]]
+        if config[1] == 66 and config[2] & 0x40:
+            profile = "Constrained Baseline"
+        level = config[3]
+        return profile, f"{level // 10}" + (f".{level % 10}" if level % 10 else "")
+
+    if config[1] >> 6:
+        raise Unsupported("HEVC profile space")
+    profile = HEVC_PROFILES[config[1] & 0x1F]
+    level = config[12]
+
+    return profile, f"{level // 30}" + (f".{level % 30 // 3}" if level % 30 else "")
+
+
+def _video_track(
+    format_: str, config: bytes, width: int, height: int, fps: float
+) -> Track:
+    profile, level = _video_profile(format_, config)
+
+    return {
+        "@type": "Video",
+        "Format": format_,
+        "InternetMediaType": INTERNET_MEDIA_TYPES[format_],
+        "Format_Profile": profile,
+        "Format_Level": level,
+        "Width": str(width),
+        "Height": str(height),
+        "FrameRate": f"{fps:.3f}",
+        "FrameRate_String": _frame_rate_string(fps),
+    }
+
+
+def _aac_channels(config: bytes) -> int | None:
+    """Channel configuration of an AAC AudioSpecificConfig, None if not set."""
+    bits = int.from_bytes(config[:5].ljust(5, b"\0"), "big")
+    # MediaInfo names the other object types (HE-AAC, ...) in its additional
+    # features, partly from the frames
+    if bits >> 35 != 2:
+        raise Unsupported("AAC object type")
+    # An explicit 24 bit sampling frequency comes before the channels
+    if bits >> 31 & 0xF == 0xF:
+        return bits >> 3 & 0xF or None
+
+    return bits >> 27 & 0xF or None
+
+
+# Matroska
+
+
+def _vint(data: bytes, pos: int, strip: bool = True) -> tuple[int, int]:
+    """Read an EBML variable length integer, return it and the position after it."""
+    first = data[pos]
+    length = 9 - first.bit_length()
+    if length > 8:
+        raise ValueError("Invalid EBML integer")
+
+    value = int.from_bytes(data[pos : pos + length], "big")
+    if strip:
+        value &= (1 << (7 * length)) - 1
+        # All ones is an unknown size
+        if value == (1 << (7 * length)) - 1:
+            value = -1
+
+    return value, pos + length
+
+
+def _elements(data: bytes, start: int = 0, end: int | None = None) -> Iterator:
+    """Yield `(id, data start, size)` of the elements between `start` and `end`."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        element_id, pos = _vint(data, pos, strip=False)
+        size, pos = _vint(data, pos)
+        yield element_id, pos, size
+        if size < 0:
+            return
+        pos += size
+
+
+def _parse(data: bytes, start: int = 0, end: int | None = None) -> list:
+    """Decode the elements of a master element into `(id, value)` pairs."""
+    values = []
+    for element_id, pos, size in _elements(data, start, end):
+        if size < 0 or pos + size > len(data):
+            raise ValueError("Truncated element")
+        value = data[pos : pos + size]
+        if element_id in MASTER_ELEMENTS:
+            values.append((element_id, _parse(data, pos, pos + size)))
+        elif element_id in STRING_ELEMENTS:
+            values.append((element_id, value.rstrip(b"\0").decode("utf-8", "replace")))
+        elif element_id in BINARY_ELEMENTS:
+            values.append((element_id, value))
+        elif element_id in FLOAT_ELEMENTS:
+            values.append(
+                (element_id, struct.unpack(">f" if size == 4 else ">d", value)[0])
+            )
+        else:
+            values.append((element_id, int.from_bytes(value, "big")))
+
+    return values
+
+
+def _get(values: list, element_id: int, default=None):
+    return next((value for key, value in values if key == element_id), default)
+
+
+def _read_at(file: BinaryIO, offset: int, head: bytes) -> tuple[int, bytes]:
+    """Read the element at `offset`, return its id and its data."""
+    if offset + 12 <= len(head):
+        data = head[offset:]
+    else:
+        file.seek(offset)
+        data = file.read(12)
+    element_id, pos = _vint(data, 0, strip=False)
+    size, pos = _vint(data, pos)
+    if size < 0 or size > MAX_ELEMENT_SIZE:
+        raise Unsupported("Element size")
+
+    if offset + pos + size <= len(head):
+        return element_id, head[offset + pos : offset + pos + size]
+    file.seek(offset + pos)
+
+    return element_id, file.read(size)
+
+
+def _read_matroska(file: BinaryIO, head: bytes, size: int) -> list[Track]:
+    elements = _elements(head)
+    element_id, pos, length = next(elements)
+    if element_id != EBML:
+        raise ValueError("Not a Matroska file")
+    element_id, segment, _ = next(_elements(head, pos + length))
+    if element_id != SEGMENT:
+        raise ValueError("No Matroska segment")
+
+    # Top level elements up to the first cluster, then whatever the seek heads
+    # point to further in the file
+    found: dict[int, list] = {}
+    positions: list[int] = []
+    with contextlib.suppress(ValueError, IndexError):
+        for element_id, pos, length in _elements(head, segment):
+            if element_id == CLUSTER or length < 0 or pos + length > len(head):
+                break
+            if element_id in (INFO, TRACKS, CHAPTERS, TAGS, SEEK_HEAD):
+                values = _parse(head, pos, pos + length)
+                if element_id == SEEK_HEAD:
+                    positions += _seek_positions(values, segment)
+                else:
+                    found.setdefault(element_id, values)
+
+    seen = set()
+    while positions:
+        offset = positions.pop(0)
+        if offset in seen or offset >= size:
+            continue
+        seen.add(offset)
+        element_id, data = _read_at(file, offset, head)
+        if element_id == SEEK_HEAD:
+            positions += _seek_positions(_parse(data), segment)
+        elif element_id in (INFO, TRACKS, CHAPTERS, TAGS) and element_id not in found:
+            found[element_id] = _parse(data)
+
+    info = found[INFO]
+    scale = _get(info, TIMESTAMP_SCALE, 1_000_000)
+    duration = _get(info, DURATION, 0) * scale / 1e9
+    if not duration:
+        raise Unsupported("Duration")
+
+    chapters = any(
+        key == EDITION_ENTRY and _get(edition, CHAPTER_ATOM) is not None
+        for key, edition in found.get(CHAPTERS, [])
+    )
+    statistics = _statistics(found.get(TAGS, []))
+
+    tracks = [_general(size, duration, chapters)]
+    for key, entry in found[TRACKS]:
+        if key == TRACK_ENTRY:
+            tracks.append(_matroska_track(entry, statistics, duration))
+
+    return tracks
+
+
+def _seek_positions(values: list, segment: int) -> list[int]:
+    return [
+        segment + _get(seek, SEEK_POSITION)
+        for key, seek in values
+        if key == SEEK
+        and int.from_bytes(_get(seek, SEEK_ID, b""), "big")
+        in (INFO, TRACKS, CHAPTERS, TAGS, SEEK_HEAD)
+    ]
+
+
+def _statistics(tags: list) -> dict[int, dict[str, str]]:
+    """Statistics tags (BPS, NUMBER_OF_BYTES, DURATION) of every track UID."""
+    statistics: dict[int, dict[str, str]] = {}
+    for key, tag in tags:
+        if key != TAG:
+            continue
+        uid = _get(_get(tag, TARGETS, []), TAG_TRACK_UID)
+        if uid:
+            statistics.setdefault(uid, {}).update(
+                (_get(simple, TAG_NAME, ""), _get(simple, TAG_STRING, ""))
+                for name, simple in tag
+                if name == SIMPLE_TAG
+            )
+
+    return statistics
+
+
+def _tag_duration(value: str) -> float:
+    hours, minutes, seconds = value.split(":")
+
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _matroska_track(
+    entry: list, statistics: dict[int, dict[str, str]], duration: float
+) -> Track:
+    codec = _get(entry, CODEC_ID, "")
+    kind = _get(entry, TRACK_TYPE)
+    stats = statistics.get(_get(entry, TRACK_UID), {})
+    with contextlib.suppress(ValueError):
+        duration = _tag_duration(stats.get("DURATION", ""))
+
+    if kind == 1:
+        format_ = MKV_VIDEO[codec]
+        video = _get(entry, VIDEO, [])
+        track = _video_track(
+            format_,
+            _get(entry, CODEC_PRIVATE, b""),
+            _get(video, PIXEL_WIDTH),
+            _get(video, PIXEL_HEIGHT),
+            1e9 / _get(entry, DEFAULT_DURATION),
+        )
+        if size := stats.get("NUMBER_OF_BYTES"):
+            track["StreamSize"] = size
+    elif kind == 2:
+        # A_AAC/MPEG4/LC and the other legacy AAC ids are AAC too
+        format_ = MKV_AUDIO["A_AAC" if codec.startswith("A_AAC") else codec]
+        channels = _get(_get(entry, AUDIO, []), CHANNELS, 1)
+        if format_ == "AAC":
+            channels = _aac_channels(_get(entry, CODEC_PRIVATE, b"")) or channels
+        track = {"@type": "Audio", "Format": format_, "Channels": str(channels)}
+        if format_ == "AAC":
+            track["Format_AdditionalFeatures"] = "LC"
+        if bitrate := stats.get("BPS"):
+            track["BitRate"] = bitrate
+        if size := stats.get("NUMBER_OF_BYTES"):
+            track["StreamSize"] = size
+    elif kind == 17:
+        track = {"@type": "Text", "Format": MKV_TEXT[codec]}
+    else:
+        raise Unsupported(f"Track type {kind}")
+
+    track["Duration"] = f"{duration:.9f}"
+    # Matroska tracks without a language element are English
+    if language := _language(
+        _get(entry, LANGUAGE_BCP47) or _get(entry, LANGUAGE) or "eng"
+    ):
+        track["Language"] = language
+    if name := _get(entry, NAME):
+        track["Title"] = name
+
+    return track
+
+
+# MP4
+
+
+def _boxes(data: bytes, start: int = 0, end: int | None = None) -> Iterator:
+    """Yield `(type, data start, data end)` of the boxes between `start` and `end`."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError("Truncated box")
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _box(data: bytes, path: str, start: int = 0, end: int | None = None):
+    """Data start and end of the first box at `path`, like `mdia/minf/stbl`."""
+    for kind in path.split("/"):
+        start, end = next(
+            ((s, e) for k, s, e in _boxes(data, start, end) if k == kind.encode()),
+            (None, None),
+        )
+        if start is None:
+            return None
+    return start, end
+
+
+def _read_mp4(file: BinaryIO, size: int) -> list[Track]:
+    # Skip from box header to box header until the movie box
+    pos = 0
+    while pos + 8 <= size:
+        file.seek(pos)
+        header = file.read(16)
+        box_size, kind = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if box_size == 1:
+            (box_size,) = struct.unpack_from(">Q", header, 8)
+            header_size = 16
+        elif box_size == 0:
+            box_size = size - pos
+        if box_size < header_size:
+            raise ValueError("Invalid box")
+        if kind == b"moov":
+            if box_size > MAX_ELEMENT_SIZE:
+                raise Unsupported("Movie box size")
+            file.seek(pos + header_size)
+            return _mp4_tracks(file.read(box_size - header_size), size)
+        pos += box_size
+
+    raise ValueError("No movie box")
+
+
+def _full_box_times(data: bytes, start: int) -> tuple[int, int]:
+    """Timescale and duration of an mvhd or mdhd box."""
+    if data[start] == 1:
+        return struct.unpack_from(">IQ", data, start + 20)
+
+    return struct.unpack_from(">II", data, start + 12)
+
+
+def _mp4_tracks(moov: bytes, size: int) -> list[Track]:
+    start, _ = _box(moov, "mvhd")
+    timescale, _ = _full_box_times(moov, start)
+    if not timescale:
+        raise Unsupported("Timescale")
+
+    chapters = _box(moov, "udta/chpl") is not None
+    tracks = []
+    for kind, start, end in _boxes(moov):
+        if kind != b"trak":
+            continue
+        # A chapter track is referenced by the other tracks and has no media type
+        # of its own in the description
+        if (tref := _box(moov, "tref", start, end)) and _box(moov, "chap", *tref):
+            chapters = True
+        if track := _mp4_track(moov, start, end, timescale):
+            tracks.append(track)
+
+    # MediaInfo takes the longest track, not the movie duration
+    duration = max((float(x["Duration"]) for x in tracks), default=0)
+    if not duration:
+        raise Unsupported("Duration")
+
+    return [_general(size, duration, chapters), *tracks]
+
+
+def _mp4_track(moov: bytes, start: int, end: int, movie_timescale: int) -> Track | None:
+    mdia = _box(moov, "mdia", start, end)
+    mdhd, _ = _box(moov, "mdhd", *mdia)
+    hdlr, _ = _box(moov, "hdlr", *mdia)
+    handler = moov[hdlr + 8 : hdlr + 12]
+    stbl = _box(moov, "minf/stbl", *mdia)
+    timescale, duration = _full_box_times(moov, mdhd)
+    seconds = duration / timescale
+
+    stsd, stsd_end = _box(moov, "stsd", *stbl)
+    entry = stsd + 8
+    entry_size, codec = struct.unpack_from(">I4s", moov, entry)
+    stream_size, samples = _stream_size(moov, *_box(moov, "stsz", *stbl))
+
+    if handler == b"vide":
+        format_ = MP4_VIDEO[codec]
+        # Visual sample entries have 78 bytes of fields before their boxes
+        config, _ = _box(
+            moov, "hvcC" if format_ == "HEVC" else "avcC", entry + 86, entry + entry_size
+        )
+        width, height = struct.unpack_from(">HH", moov, entry + 32)
+        track = _video_track(format_, moov[config:], width, height, samples / seconds)
+        track["StreamSize"] = str(stream_size)
+    elif handler == b"soun":
+        format_ = MP4_AUDIO[codec]
+        version, _, _, channels = struct.unpack_from(">HHIH", moov, entry + 16)
+        # QuickTime sound sample entries of version 1 and 2 have more fields
+        boxes = (entry + (36, 52, 72)[version], entry + entry_size)
+        if format_ == "AAC":
+            channels = _esds_channels(moov, *_box(moov, "esds", *boxes)) or channels
+        elif format_ == "AC-3":
+            channels = _dac3_channels(moov, _box(moov, "dac3", *boxes)[0])
+        track = {
+            "@type": "Audio",
+            "Format": format_,
+            "Channels": str(channels),
+            "StreamSize": str(stream_size),
+            "BitRate": str(round(stream_size * 8 / seconds)),
+        }
+        if format_ == "AAC":
+            track["Format_AdditionalFeatures"] = "LC"
+    elif handler in (b"sbtl", b"text", b"subt"):
+        track = {"@type": "Text", "Format": MP4_TEXT[codec]}
+    else:
+        return None
+
+    # The track header has the duration after edit lists, in the movie timescale.
+    # MediaInfo rounds it down to whole milliseconds.
+    tkhd, _ = _box(moov, "tkhd", start, end)
+    if moov[tkhd] == 1:
+        (duration,) = struct.unpack_from(">Q", moov, tkhd + 28)
+    else:
+        (duration,) = struct.unpack_from(">I", moov, tkhd + 20)
+    track["Duration"] = f"{duration * 1000 // movie_timescale / 1000:.3f}"
+    (packed,) = struct.unpack_from(">H", moov, mdhd + (32 if moov[mdhd] == 1 else 20))
+    code = "".join(chr((packed >> shift & 0x1F) + 0x60) for shift in (10, 5, 0))
+    if elng := _box(moov, "elng", *mdia):
+        code = moov[elng[0] + 4 : elng[1]].rstrip(b"\0").decode()
+    if language := _language(code):
+        track["Language"] = language
+    if name := _box(moov, "udta/name", start, end):
+        track["Title"] = moov[name[0] : name[1]].rstrip(b"\0").decode("utf-8", "replace")
+
+    return track
+
+
+def _stream_size(moov: bytes, start: int, _end: int) -> tuple[int, int]:
+    """Total size and count of the samples in an stsz box."""
+    sample_size, count = struct.unpack_from(">II", moov, start + 4)
+    if sample_size:
+        return sample_size * count, count
+
+    return sum(struct.unpack_from(f">{count}I", moov, start + 12)), count
+
+
+def _esds_channels(data: bytes, start: int, end: int) -> int | None:
+    """Channel configuration of the AAC decoder config in an esds box."""
+    pos = start + 4
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        length = 0
+        for _ in range(4):
+            byte = data[pos]
+            pos += 1
+            length = length << 7 | byte & 0x7F
+            if not byte & 0x80:
+                break
+        if tag == 0x03:
+            flags = data[pos + 2]
+            pos += 3
+            if flags & 0x80:
+                pos += 2
+            if flags & 0x40:
+                pos += 1 + data[pos]
+            if flags & 0x20:
+                pos += 2
+        elif tag == 0x04:
+            if data[pos] != 0x40:
+                raise Unsupported("Not MPEG-4 audio")
+            pos += 13
+        elif tag == 0x05:
+            return _aac_channels(data[pos : pos + length])
+        else:
+            pos += length
+
+    raise Unsupported("AAC config")
+
+
+def _dac3_channels(data: bytes, start: int) -> int:
+    bits = int.from_bytes(data[start : start + 3], "big")
+
+    return AC3_CHANNELS[bits >> 11 & 0x7] + (bits >> 10 & 0x1)
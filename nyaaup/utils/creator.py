@@ -0,0 +1,172 @@
+import io
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout, suppress
+from dataclasses import asdict, replace
+from pathlib import Path
+
+import orjson
+import torf
+
+from nyaaup.utils import which
+from nyaaup.utils.hasher import ReadOptions
+from nyaaup.utils.logging import iprint
+from nyaaup.utils.torrent import create_torrent, torrenttools_unsupported
+
+BACKENDS = ("torf", "native", "torrenttools")
+AUTO_CLASSES = (
+    # (size class, largest input of the class, benchmark file size)
+    ("small", 256 * 1024**2, 16 * 1024**2),
+    ("large", None, 128 * 1024**2),
+)
+CHUNK_SIZE = 8 * 1024 * 1024  # 8 MiB
+
+
+def available_backends() -> list[str]:
+    return [x for x in BACKENDS if x != "torrenttools" or which("torrenttools")]
+
+
+def size_class(size: int) -> str:
+    return next(name for name, limit, _ in AUTO_CLASSES if limit is None or size < limit)
+
+
+def _fingerprint(
+    threads: int | None,
+    version: str,
+    read_options: ReadOptions | None,
+    checkpoint_interval: float,
+) -> dict:
+    """What the benchmark result depends on, a change triggers a new benchmark."""
+    # nyaaup/__init__.py imports the commands before it defines the version
+    from nyaaup import __version__
+
+    tools = {}
+    if executable := which("torrenttools"):
+        stat = executable.stat()
+        tools["torrenttools"] = [str(executable), stat.st_size, stat.st_mtime_ns]
+
+    return {
+        "backends": available_backends(),
+        "tools": tools,
+        "torf": torf.__version__,
+        "nyaaup": __version__,
+        "cpu_count": os.cpu_count(),
+        "threads": threads,
+        "version": version,
+        # The benchmark runs unthrottled, the read limit does not change it
+        "read_options": {
+            key: value
+            for key, value in asdict(read_options or ReadOptions()).items()
+            if key != "bwlimit"
+        },
+        "checkpoint_interval": checkpoint_interval,
+    }
+
+
+def _write_sample(path: Path, size: int) -> None:
+    with path.open("wb") as f:
+        for offset in range(0, size, CHUNK_SIZE):
+            f.write(os.urandom(min(CHUNK_SIZE, size - offset)))
+
+
+def _benchmark_backends(
+    directory: Path,
+    threads: int | None,
+    version: str,
+    read_options: ReadOptions | None,
+    checkpoint_interval: float,
+) -> dict[str, str]:
+    """
+    Return the fastest backend of every size class, timing `create_torrent` with
+    the options of the upload so every creator runs the path it runs for real.
+    Reads are not limited, a limit would make every creator equally slow.
+    """
+    read_options = replace(read_options, bwlimit=0) if read_options else None
+    choice = {}
+    with tempfile.TemporaryDirectory(prefix="nyaaup-auto-", dir=directory) as tmp:
+        for name, _, size in AUTO_CLASSES:
+            path = Path(tmp, f"{name}.bin")
+            _write_sample(path, size)
+            seconds = {}
+            for backend in available_backends():
+                runs = []
+                with (
+                    suppress(subprocess.CalledProcessError, OSError),
+                    redirect_stdout(io.StringIO()),
+                ):
+                    # Best of two, the first run also warms up the page cache
+                    for _ in range(2):
+                        start = time.perf_counter()
+                        if not create_torrent(
+                            name,
+                            path,
+                            Path(tmp),
+                            [],
+                            True,
+                            backend,
+                            version=version,
+                            read_options=read_options,
+                            checkpoint_interval=checkpoint_interval,
+                            threads=threads,
+                        ):
+                            break
+                        runs.append(time.perf_counter() - start)
+                if len(runs) == 2:
+                    seconds[backend] = min(runs)
+            choice[name] = min(seconds, key=seconds.__getitem__, default="torf")
+
+    return choice
+
+
+def auto_backend(
+    cache_dir: Path,
+    size: int,
+    threads: int | None = None,
+    version: str = "1",
+    read_options: ReadOptions | None = None,
+    checkpoint_interval: float = 60,
+) -> str:
+    """
+    Return the fastest torrent creator for an input of `size` bytes.
+
+    The installed creators are benchmarked once per host and the result is kept
+    in `cache_dir`, until the host, the installed tools, their versions or the
+    hashing options change. torrenttools is not used with read options it
+    ignores, the native creator is used instead.
+    """
+    cache_file = cache_dir / "torrent_creator.json"
+    host = platform.node()
+    fingerprint = _fingerprint(threads, version, read_options, checkpoint_interval)
+
+    hosts = {}
+    with suppress(OSError, orjson.JSONDecodeError):
+        hosts = orjson.loads(cache_file.read_bytes())
+
+    entry = hosts.get(host)
+    if not entry or entry.get("fingerprint") != fingerprint:
+        iprint("Benchmarking torrent creators, once per host...", 0)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "fingerprint": fingerprint,
+            "choice": _benchmark_backends(
+                cache_dir, threads, version, read_options, checkpoint_interval
+            ),
+        }
+        hosts[host] = entry
+        tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(orjson.dumps(hosts, option=orjson.OPT_INDENT_2))
+        tmp.replace(cache_file)
+        iprint(
+            "Torrent creators: "
+            + ", ".join(f"{name} {backend}" for name, backend in entry["choice"].items()),
+            0,
+        )
+
+    backend = entry["choice"].get(size_class(size), "torf")
+    if backend == "torrenttools" and torrenttools_unsupported(read_options):
+        return "native"
+
+    return backend
@@ -1,5 +1,6 @@
 import re
 import time
+from typing import TYPE_CHECKING
 
 import niquests
 from mal import Anime, AnimeSearch
@@ -10,7 +11,9 @@ from nyaaup.utils import similar
 from nyaaup.utils.collections import first, first_or_else, first_or_none
 from nyaaup.utils.logging import eprint, wprint
 from nyaaup.utils.regex import find
-from nyaaup.utils.uploader import Uploader
+
+if TYPE_CHECKING:
+    from nyaaup.utils.uploader import Uploader
 
 
 def extract_name_from_filename(file_name: str) -> tuple[str, bool, str | None]:
@@ -175,7 +178,7 @@ def get_mal_link(mal_url: str, search_name: str, console: Console) -> Anime | No
 
 
 def _get_anilist_title(
-    uploader: Uploader, anilist_data: dict, search_name: str
+    uploader: "Uploader", anilist_data: dict, search_name: str
 ) -> str | None:
     title: dict[str, str] = anilist_data.get("title", {})
     if uploader.is_non_english_category and title.get("english"):
@@ -194,7 +197,7 @@ def _get_anilist_title(
     return None
 
 
-def _get_mal_title(uploader: Uploader, mal_data: Anime, search_name: str) -> str:
+def _get_mal_title(uploader: "Uploader", mal_data: Anime, search_name: str) -> str:
     if (
         uploader.is_non_english_category
         and mal_data.title_english
@@ -216,7 +219,7 @@ def _get_mal_title(uploader: Uploader, mal_data: Anime, search_name: str) -> str
     return ""
 
 
-def process_mal_info(uploader: Uploader, name: str, max_retries: int = 3) -> str:
+def process_mal_info(uploader: "Uploader", name: str, max_retries: int = 3) -> str:
     """Process MAL info and return information and name additions"""
     search_name, _, _ = extract_name_from_filename(name)
 
@@ -254,7 +257,7 @@ def process_mal_info(uploader: Uploader, name: str, max_retries: int = 3) -> str
     return ""
 
 
-def process_anilist_info(uploader: Uploader, name: str) -> str:
+def process_anilist_info(uploader: "Uploader", name: str) -> str:
     """Process AniList info and return information and name additions"""
     search_name, is_movie, season = extract_name_from_filename(name)
 
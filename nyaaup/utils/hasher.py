@@ -0,0 +1,540 @@
+import hashlib
+import io
+import math
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from nyaaup.utils.priority import lower_thread_priority
+
+READ_SIZE = 8 * 1024 * 1024  # 8 MiB
+BLOCK_SIZE = 16 * 1024  # BEP 52 merkle leaf size
+ZERO_HASH = bytes(32)
+DIRECT_IO_ALIGN = 4096
+
+
+class TokenBucket:
+    """Limit the combined throughput of several threads to `rate` bytes per second."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._lock = threading.Lock()
+        # Allow a burst of one second
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+
+    def consume(self, count: int) -> None:
+        """Take `count` bytes from the bucket, sleep until the debt is paid off."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= count
+            delay = -self._tokens / self.rate
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class ReadOptions:
+    """How the hashers read the payload."""
+
+    # Bytes per read, rounded to whole pieces
+    read_size: int = READ_SIZE
+    # Drop what was read from the page cache, so hashing does not evict hot data
+    drop_cache: bool = False
+    # Bypass the page cache with O_DIRECT where the platform supports it
+    direct_io: bool = False
+    # Bytes per second shared by all reader threads, 0 for no limit
+    bwlimit: int = 0
+    # Hash on threads with the lowest CPU priority
+    idle: bool = False
+
+    def __post_init__(self) -> None:
+        self.limiter = TokenBucket(self.bwlimit) if self.bwlimit > 0 else None
+
+
+class _Reader:
+    """Read ranges of one file, honouring `ReadOptions`."""
+
+    def __init__(self, path: Path, options: ReadOptions):
+        self.path = path
+        self.options = options
+        self.direct = options.direct_io and hasattr(os, "O_DIRECT")
+        self._buffer: mmap.mmap | None = None
+
+        try:
+            self.handle = self._open(direct=self.direct)
+        except OSError:
+            if not self.direct:
+                raise
+            # Some filesystems (tmpfs, some FUSE) refuse O_DIRECT
+            self.direct = False
+            self.handle = self._open(direct=False)
+
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def _open(self, direct: bool) -> io.FileIO:
+        flags = os.O_DIRECT if direct else 0
+
+        return io.FileIO(self.path, "rb", opener=lambda p, f: os.open(p, f | flags))
+
+    def close(self) -> None:
+        self.handle.close()
+        if self._buffer is not None:
+            self._buffer.close()
+
+    def __enter__(self) -> "_Reader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def read_exactly(self, view: memoryview, offset: int) -> None:
+        """Fill `view` with the bytes at `offset`, raise OSError at end of file."""
+        pos = 0
+        while pos < len(view):
+            if not (got := self.readinto(view[pos:], offset + pos)):
+                raise OSError(f"Unexpected end of file: {self.path}")
+            pos += got
+
+    def readinto(self, view: memoryview, offset: int) -> int:
+        if self.direct:
+            got = self._readinto_direct(view, offset)
+        else:
+            self.handle.seek(offset)
+            got = self.handle.readinto(view) or 0
+
+        if self.options.drop_cache and got and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.handle.fileno(), offset, got, os.POSIX_FADV_DONTNEED)
+        if self.options.limiter and got:
+            self.options.limiter.consume(got)
+
+        return got
+
+    def _readinto_direct(self, view: memoryview, offset: int) -> int:
+        """O_DIRECT needs aligned offsets, lengths and memory, so read via a bounce buffer."""
+        start = offset - offset % DIRECT_IO_ALIGN
+        length = -(-(offset + len(view) - start) // DIRECT_IO_ALIGN) * DIRECT_IO_ALIGN
+
+        if self._buffer is None or len(self._buffer) < length:
+            if self._buffer is not None:
+                self._buffer.close()
+            # Anonymous maps are page aligned
+            self._buffer = mmap.mmap(-1, max(length, self.options.read_size))
+
+        self.handle.seek(start)
+        got = self.handle.readinto(memoryview(self._buffer)[:length]) or 0
+        got = max(0, min(got - (offset - start), len(view)))
+        view[:got] = memoryview(self._buffer)[offset - start : offset - start + got]
+
+        return got
+
+
+class HashCancelled(Exception):
+    pass
+
+
+class _HashPool:
+    """
+    Run hashing tasks on a thread pool and report progress from the caller.
+
+    Setting `cancel` (or calling `cancel()`) from any thread stops the workers
+    and makes the running hash raise `HashCancelled` in the calling thread.
+    """
+
+    def __init__(
+        self,
+        threads: int | None = None,
+        options: ReadOptions | None = None,
+        cancel: threading.Event | None = None,
+    ):
+        self.threads = max(1, threads or os.cpu_count() or 1)
+        self.options = options or ReadOptions()
+        self.cancelled = cancel or threading.Event()
+
+        self._lock = threading.Lock()
+        # Stops the workers of one run after an error, unlike `cancelled`
+        self._cancel = threading.Event()
+        self._done = 0
+        self._current = ""
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def _run(
+        self,
+        worker: Callable[..., Any],
+        tasks: list[tuple],
+        total: int,
+        callback: Callable[[str, int, int], None] | None,
+        interval: float,
+    ) -> list[Any]:
+        """
+        Call `worker` with every task in `tasks` and return the results in order.
+
+        `callback` is called from the calling thread at most every `interval`
+        seconds with the file currently being hashed, the number of hashed
+        pieces and `total`.
+        """
+        self._done = 0
+        self._cancel.clear()
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.threads,
+            initializer=lower_thread_priority if self.options.idle else None,
+        )
+        futures = [executor.submit(worker, *task) for task in tasks]
+        try:
+            pending = set(futures)
+            while pending:
+                done, pending = wait(
+                    pending, timeout=interval, return_when=FIRST_EXCEPTION
+                )
+                for future in done:
+                    future.result()
+                if self.cancelled.is_set():
+                    raise HashCancelled
+                if callback:
+                    callback(self._current, self._done, total)
+        except BaseException:
+            self._cancel.set()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return [future.result() for future in futures]
+
+    def _advance(self, count: int) -> None:
+        if self._cancel.is_set() or self.cancelled.is_set():
+            raise HashCancelled
+
+        with self._lock:
+            self._done += count
+
+
+class PieceHasher(_HashPool):
+    """
+    Hash v1 torrent pieces across a pool of worker threads.
+
+    The requested pieces are split into contiguous spans, one batch per worker,
+    so every worker streams its part of the payload sequentially with large
+    reads. hashlib releases the GIL while hashing, so threads scale with cores.
+
+    A file without a path is read as zeros, like a BEP 47 pad file.
+    """
+
+    def __init__(
+        self,
+        files: Sequence[tuple[str | Path | None, int]],
+        piece_size: int,
+        threads: int | None = None,
+        options: ReadOptions | None = None,
+        cancel: threading.Event | None = None,
+    ):
+        super().__init__(threads, options, cancel)
+
+        self.files = [(path and Path(path), size) for path, size in files]
+        self.piece_size = piece_size
+        self.read_size = max(1, self.options.read_size // piece_size) * piece_size
+
+        self.starts: list[int] = []
+        offset = 0
+        for _, size in self.files:
+            self.starts.append(offset)
+            offset += size
+        self.total_size = offset
+        self.pieces = math.ceil(self.total_size / piece_size)
+        self._results: dict[int, bytes] = {}
+
+    def hash(
+        self,
+        indices: Iterable[int] | None = None,
+        callback: Callable[[str, int, int], None] | None = None,
+        interval: float = 1,
+        checkpoint: Callable[[dict[int, bytes]], None] | None = None,
+        checkpoint_interval: float = 60,
+    ) -> dict[int, bytes]:
+        """
+        Hash the pieces in `indices` (all pieces if None).
+
+        `checkpoint` is called from the calling thread with the pieces hashed so
+        far every `checkpoint_interval` seconds and when hashing is interrupted.
+        """
+        wanted = sorted(set(range(self.pieces) if indices is None else indices))
+        self._results = {}
+        saved = time.monotonic()
+
+        def report(current: str, done: int, total: int) -> None:
+            nonlocal saved
+            if callback:
+                callback(current, done, total)
+            if checkpoint and time.monotonic() - saved >= checkpoint_interval:
+                checkpoint(dict(self._results))
+                saved = time.monotonic()
+
+        try:
+            self._run(self._hash_span, self._split(wanted), len(wanted), report, interval)
+        except BaseException:
+            if checkpoint and self._results:
+                checkpoint(dict(self._results))
+            raise
+
+        return self._results
+
+    def _split(self, indices: list[int]) -> list[tuple[int, int]]:
+        """Group indices into contiguous [first, last) spans, balanced per worker."""
+        if not indices:
+            return []
+
+        limit = max(1, math.ceil(len(indices) / self.threads))
+        spans: list[tuple[int, int]] = []
+        first = prev = indices[0]
+        for index in indices[1:]:
+            if index != prev + 1 or index - first >= limit:
+                spans.append((first, prev + 1))
+                first = index
+            prev = index
+        spans.append((first, prev + 1))
+
+        return spans
+
+    def _hash_span(self, first: int, last: int) -> None:
+        # Results go straight to the shared dict, so checkpoints see every piece
+        hashes = self._results
+        buffer = bytearray(self.read_size)
+        view = memoryview(buffer)
+        handles: dict[int, _Reader] = {}
+        per_read = self.read_size // self.piece_size
+
+        try:
+            index = first
+            while index < last:
+                count = min(per_read, last - index)
+                start = index * self.piece_size
+                length = min(count * self.piece_size, self.total_size - start)
+                self._read(view[:length], start, handles)
+
+                for num in range(count):
+                    pos = num * self.piece_size
+                    piece = view[pos : min(pos + self.piece_size, length)]
+                    hashes[index + num] = hashlib.sha1(piece).digest()
+
+                index += count
+                self._advance(count)
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def _read(self, view: memoryview, offset: int, handles: dict[int, _Reader]) -> None:
+        """Fill `view` with payload bytes starting at global `offset`."""
+        pos = 0
+        while pos < len(view):
+            num = bisect_right(self.starts, offset) - 1
+            path, size = self.files[num]
+            file_offset = offset - self.starts[num]
+
+            if path is None:
+                want = min(len(view) - pos, size - file_offset)
+                view[pos : pos + want] = bytes(want)
+                pos += want
+                offset += want
+                continue
+
+            if num not in handles:
+                for handle in handles.values():
+                    handle.close()
+                handles.clear()
+                handles[num] = _Reader(path, self.options)
+                self._current = str(path)
+
+            want = min(len(view) - pos, size - file_offset)
+            got = handles[num].readinto(view[pos : pos + want], file_offset)
+            if not got:
+                raise OSError(f"Unexpected end of file: {path}")
+
+            pos += got
+            offset += got
+
+
+@dataclass
+class FileHashes:
+    """Hashes of a single file laid out from a piece boundary (BEP 47/52)."""
+
+    # v1 SHA-1 of every piece, the last one padded with zeros to the piece size
+    pieces: bytes
+    # v1 SHA-1 of the unpadded last piece, empty if the size is a piece multiple
+    tail: bytes
+    # v2 piece layer, empty for files not larger than one piece
+    piece_layer: bytes
+    # v2 pieces root
+    root: bytes
+
+
+def merkle_root(hashes: Sequence[bytes], count: int, pad: bytes = ZERO_HASH) -> bytes:
+    """Root of a SHA-256 tree over `hashes` padded with `pad` to `count` leaves."""
+    layer = list(hashes)
+    while count > 1:
+        if len(layer) % 2:
+            layer.append(pad)
+        layer = [
+            hashlib.sha256(layer[num] + layer[num + 1]).digest()
+            for num in range(0, len(layer), 2)
+        ]
+        pad = hashlib.sha256(pad + pad).digest()
+        count //= 2
+
+    return layer[0]
+
+
+def _pad_root(leaves: int) -> bytes:
+    """Root of a tree of `leaves` zero hashes."""
+    pad = ZERO_HASH
+    for _ in range(leaves.bit_length() - 1):
+        pad = hashlib.sha256(pad + pad).digest()
+
+    return pad
+
+
+def _next_power_of_two(num: int) -> int:
+    return 1 << max(0, num - 1).bit_length()
+
+
+class FileHasher(_HashPool):
+    """
+    Hash files one by one for v2 and piece-aligned v1 (hybrid) torrents.
+
+    Every file starts on a piece boundary, so its hashes do not depend on the
+    other files of the torrent and can be cached and reused per file.
+    """
+
+    def __init__(
+        self,
+        piece_size: int,
+        threads: int | None = None,
+        v1: bool = True,
+        options: ReadOptions | None = None,
+        cancel: threading.Event | None = None,
+    ):
+        super().__init__(threads, options, cancel)
+
+        self.piece_size = piece_size
+        self.v1 = v1
+        self.read_size = max(1, self.options.read_size // piece_size) * piece_size
+
+    def hash(
+        self,
+        files: Sequence[tuple[str | Path, int]],
+        callback: Callable[[str, int, int], None] | None = None,
+        interval: float = 1,
+    ) -> list[FileHashes]:
+        counts = [math.ceil(size / self.piece_size) for _, size in files]
+        limit = max(1, math.ceil(sum(counts) / self.threads))
+
+        tasks = [
+            (Path(path), size, first, min(first + limit, count))
+            for (path, size), count in zip(files, counts, strict=True)
+            for first in range(0, count, limit)
+        ]
+        spans = iter(self._run(self._hash_span, tasks, sum(counts), callback, interval))
+
+        results = []
+        for (_, size), count in zip(files, counts, strict=True):
+            pieces: list[tuple[bytes, bytes, bytes]] = []
+            for _ in range(0, count, limit):
+                pieces.extend(next(spans))
+            results.append(self._assemble(size, pieces))
+
+        return results
+
+    def hash_pieces(
+        self,
+        pieces: Sequence[tuple[str | Path, int, int]],
+        callback: Callable[[str, int, int], None] | None = None,
+        interval: float = 1,
+    ) -> list[bytes]:
+        """
+        Return the v2 piece layer entry of every (path, size, index) in `pieces`,
+        or the pieces root for files not larger than one piece.
+        """
+        tasks = [(Path(path), size, index, index + 1) for path, size, index in pieces]
+
+        return [
+            span[0][2]
+            for span in self._run(self._hash_span, tasks, len(tasks), callback, interval)
+        ]
+
+    def _assemble(
+        self, size: int, pieces: list[tuple[bytes, bytes, bytes]]
+    ) -> FileHashes:
+        v1 = b"".join(padded for padded, _, _ in pieces)
+        tail = pieces[-1][1] if size % self.piece_size else b""
+
+        if size <= self.piece_size:
+            return FileHashes(pieces=v1, tail=tail, piece_layer=b"", root=pieces[0][2])
+
+        layer = [node for _, _, node in pieces]
+        root = merkle_root(
+            layer,
+            _next_power_of_two(len(layer)),
+            pad=_pad_root(self.piece_size // BLOCK_SIZE),
+        )
+
+        return FileHashes(pieces=v1, tail=tail, piece_layer=b"".join(layer), root=root)
+
+    def _hash_span(
+        self, path: Path, size: int, first: int, last: int
+    ) -> list[tuple[bytes, bytes, bytes]]:
+        """Return (padded SHA-1, unpadded SHA-1, v2 node) for pieces [first, last)."""
+        results = []
+        buffer = bytearray(self.read_size)
+        view = memoryview(buffer)
+        per_read = self.read_size // self.piece_size
+        blocks_per_piece = self.piece_size // BLOCK_SIZE
+
+        with _Reader(path, self.options) as reader:
+            self._current = str(path)
+
+            index = first
+            while index < last:
+                count = min(per_read, last - index)
+                start = index * self.piece_size
+                length = min(count * self.piece_size, size - start)
+                reader.read_exactly(view[:length], start)
+
+                for num in range(count):
+                    pos = num * self.piece_size
+                    piece = view[pos : min(pos + self.piece_size, length)]
+
+                    padded = unpadded = b""
+                    if self.v1:
+                        sha1 = hashlib.sha1(piece)
+                        unpadded = sha1.digest()
+                        if len(piece) < self.piece_size:
+                            sha1.update(bytes(self.piece_size - len(piece)))
+                        padded = sha1.digest()
+
+                    leaves = [
+                        hashlib.sha256(piece[block : block + BLOCK_SIZE]).digest()
+                        for block in range(0, len(piece), BLOCK_SIZE)
+                    ]
+                    count_leaves = (
+                        blocks_per_piece
+                        if size > self.piece_size
+                        else _next_power_of_two(len(leaves))
+                    )
+                    results.append((padded, unpadded, merkle_root(leaves, count_leaves)))
+
+                index += count
+                self._advance(count)
+
+        return results
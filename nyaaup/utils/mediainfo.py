@@ -1,12 +1,30 @@
+import contextlib
+import hashlib
+import multiprocessing
+import os
 import re
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
 
 import orjson
 from langcodes import Language
 from pymediainfo import MediaInfo
 
+from nyaaup.utils.cache import DiskCache, pack, unpack
+from nyaaup.utils.container import read_tracks
 from nyaaup.utils.logging import eprint, wprint
 
+# Bump when the cached MediaInfoResult layout changes
+CACHE_VERSION = 1
+# Probe tiers and their MediaInfo parse speed, tried in order until the
+# description has every field
+PROBE_TIERS = (("native", 0.0), ("header", 0.0), ("sample", 0.5), ("full", 1.0))
+
 SUB_CODEC_MAP = {"UTF-8": "SRT"}
 AUDIO_CODEC_MAP = {
     "E-AC-3": "DDP",
@@ -20,41 +38,338 @@ CHANNEL_MAP = {
     "6": "5.1",
     "8": "7.1",
 }
+# Fields of each track type that the description shows, episodes of a batch
+# with the same values share one description
+LAYOUT_FIELDS = {
+    "Video": ("Format", "Format_Profile", "Width", "Height", "FrameRate_String"),
+    "Audio": ("Format", "Channels", "Language", "Title", "Format_AdditionalFeatures"),
+    "Text": ("Format", "Language", "Title"),
+}
 
 
-def parse_mediainfo(file_path: Path):
+@dataclass
+class MediaInfoResult:
+    """The JSON tracks and the text report of one MediaInfo parse."""
+
+    tracks: list[dict[str, str | int]] = field(default_factory=list)
+    text: str = ""
+    # Probe tier the result comes from and the seconds spent in each tier,
+    # not cached
+    tier: str = ""
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def parse_mediainfo(
+    file_path: Path,
+    parse_speed: float = 1.0,
+    cache: DiskCache | None = None,
+    text: bool = True,
+) -> MediaInfoResult:
+    """
+    Probe `file_path` in tiers up to `parse_speed`: the Matroska or MP4 headers
+    read natively (only without `text`, the text report needs MediaInfo), then
+    MediaInfo on the headers, a window of the file and all of it. The next tier
+    only runs if a field of the description is still missing after deriving what
+    it can from the fields already known.
+    With `cache`, an unchanged file is not parsed again.
+    """
+    key = None
+    if cache:
+        try:
+            key = _cache_key(file_path, parse_speed)
+            if (value := cache.get(key)) and (
+                (cached := _load_result(value)).text or not text
+            ):
+                return cached
+        except (OSError, KeyError, ValueError, zlib.error) as e:
+            wprint(f"Failed to read cached mediainfo: {e}")
+
+    mediainfo = MediaInfoResult()
+    missing: list[str] = []
+    timings: dict[str, float] = {}
     try:
-        mediainfo = _get_mediainfo(file_path)
-
-        if not mediainfo[0]["Duration"] or any(
-            m.get("@type", "") in ("Audio", "General") and not m.get("BitRate")
-            for m in mediainfo
-        ):
-            mediainfo = _get_mediainfo(file_path, 1)
+        for tier, speed in PROBE_TIERS:
+            if speed > parse_speed:
+                break
+            if tier == "native" and text:
+                continue
+            if tier == "full":
+                wprint(f"{file_path.name}: {', '.join(missing)} unknown, reading it all")
+
+            start = time.perf_counter()
+            if tier == "native":
+                mediainfo = MediaInfoResult(read_tracks(file_path) or [])
+            else:
+                mediainfo = get_mediainfo(file_path, speed)
+            missing = fill_missing(mediainfo.tracks)
+            timings[tier] = time.perf_counter() - start
+            mediainfo.tier = tier
+
+            if not missing or not mediainfo.tracks and tier != "native":
+                break
     except Exception as e:
         eprint(f"MediaInfo error: {e}")
-        mediainfo = []
+        return MediaInfoResult()
+
+    if not mediainfo.tracks:
+        eprint(f"MediaInfo error: no tracks found in {file_path.name}")
+        return mediainfo
+    mediainfo.timings = timings
+
+    if cache and key:
+        cache.set(key, _dump_result(mediainfo))
 
     return mediainfo
 
 
-def _get_mediainfo(
-    file_path: Path, parse_speed: float = 0.5
-) -> list[dict[str, str | int]]:
-    mediainfo: dict[str, str | int] = {}
-    try:
-        mediainfo = orjson.loads(
-            MediaInfo.parse(
-                file_path,
-                output="JSON",
-                parse_speed=parse_speed,
-                full=True,
+def format_timings(result: MediaInfoResult) -> str:
+    """The tier `result` comes from and the seconds spent in every tier tried."""
+    timings = ", ".join(
+        f"{tier} {seconds:.2f}s" for tier, seconds in result.timings.items()
+    )
+
+    return f"{result.tier} tier ({timings})"
+
+
+def fill_missing(tracks: list[dict[str, str | int]]) -> list[str]:
+    """
+    Derive the bitrates the description needs from the fields that are known,
+    return the ones that are still missing.
+    """
+    missing = []
+    general = next((x for x in tracks if x.get("@type") == "General"), {})
+    if not general.get("Duration"):
+        missing.append("duration")
+
+    for num, track in enumerate((x for x in tracks if x["@type"] == "Audio"), 1):
+        if not track.get("BitRate"):
+            with contextlib.suppress(KeyError, ValueError, ZeroDivisionError):
+                track["BitRate"] = track.get("BitRate_Nominal") or str(
+                    round(float(track["StreamSize"]) * 8 / float(track["Duration"]))
+                )
+        if not track.get("BitRate"):
+            missing.append(f"audio {num} bitrate")
+
+    videos = [x for x in tracks if x["@type"] == "Video"]
+    if len(videos) == 1 and not videos[0].get("StreamSize"):
+        # The file without every other stream is the video and a container
+        # overhead well below 1%
+        with contextlib.suppress(KeyError, ValueError):
+            others = sum(
+                _stream_size(x) for x in tracks if x["@type"] not in ("General", "Video")
             )
-        )
+            videos[0]["StreamSize"] = str(round(float(general["FileSize"]) - others))
+    if any(not x.get("StreamSize") for x in videos):
+        missing.append("video bitrate")
+
+    return missing
+
+
+def _stream_size(track: dict[str, str | int]) -> float:
+    if track.get("StreamSize"):
+        return float(track["StreamSize"])
+    if track["@type"] == "Audio":
+        return float(track["BitRate"]) * float(track["Duration"]) / 8
+
+    # Subtitles, chapters and attachments are small next to the video
+    return 0
+
+
+def _cache_key(file_path: Path, parse_speed: float) -> str:
+    """Key a result by (path, size, mtime_ns) of the file and the parse speed."""
+    stat = file_path.stat()
+    identity = [str(file_path.absolute()), stat.st_size, stat.st_mtime_ns, parse_speed]
+
+    return f"mediainfo:{hashlib.sha256(orjson.dumps(identity)).hexdigest()}"
+
+
+def _dump_result(result: MediaInfoResult) -> bytes:
+    # The JSON report repeats its keys in every track, it compresses about 10x
+    return pack(
+        {"version": CACHE_VERSION},
+        zlib.compress(orjson.dumps({"tracks": result.tracks, "text": result.text})),
+    )
+
+
+def _load_result(value: bytes) -> MediaInfoResult:
+    header, payload = unpack(value)
+    if header.get("version") != CACHE_VERSION:
+        raise ValueError("Unknown cache version")
+    data = orjson.loads(zlib.decompress(payload))
+
+    return MediaInfoResult(data["tracks"], data["text"], tier="cache")
+
+
+def get_mediainfo(file_path: Path, parse_speed: float = 0.5) -> MediaInfoResult:
+    """
+    Open `file_path` once and render both reports from the same parse, instead of
+    a `MediaInfo.parse` (and a read of the file) per output format.
+    """
+    try:
+        lib, handle, _, _ = MediaInfo._get_library()
     except Exception as e:
         wprint(f"Failed to get mediainfo: {e}")
+        return MediaInfoResult()
+
+    try:
+        lib.MediaInfo_Option(handle, "CharSet", "UTF-8")
+        lib.MediaInfo_Option(handle, "ParseSpeed", str(parse_speed))
+        if lib.MediaInfo_Open(handle, str(file_path)) == 0:
+            raise RuntimeError(f"Could not open {file_path}")
+
+        lib.MediaInfo_Option(handle, "Inform", "JSON")
+        lib.MediaInfo_Option(handle, "Complete", "1")
+        report = orjson.loads(lib.MediaInfo_Inform(handle, 0))
+        tracks = (report.get("media") or {}).get("track", [])
+
+        lib.MediaInfo_Option(handle, "Inform", "")
+        lib.MediaInfo_Option(handle, "Complete", "")
+        text = lib.MediaInfo_Inform(handle, 0)
+    except Exception as e:
+        wprint(f"Failed to get mediainfo: {e}")
+        return MediaInfoResult()
+    finally:
+        lib.MediaInfo_Close(handle)
+        lib.MediaInfo_Delete(handle)
+
+    return MediaInfoResult(tracks, text)
+
+
+@dataclass
+class BatchMediaInfo:
+    """MediaInfo of every episode of a batch, summarised as one file."""
+
+    # Episode the summary is based on, one with the most common track layout
+    file: Path
+    # Its report, with video and audio bitrates over all episodes of that layout
+    result: MediaInfoResult
+    # Why an episode differs from the common layout
+    outliers: dict[Path, str] = field(default_factory=dict)
+    # Result of every episode, for the probe tiers and their timings
+    episodes: dict[Path, MediaInfoResult] = field(default_factory=dict)
+
+
+def parse_batch(
+    files: list[Path],
+    cache: DiskCache | None = None,
+    workers: int | None = None,
+    text: bool = True,
+) -> BatchMediaInfo:
+    """
+    Parse every episode in a process pool and summarise the common track layout.
+
+    libmediainfo is not safe to run on several threads at once, so the episodes
+    are parsed in worker processes. Cached episodes are read here, not in a worker.
+    """
+    cached: set[Path] = set()
+    if cache:
+        keys = {}
+        for file in files:
+            with contextlib.suppress(OSError):
+                keys[_cache_key(file, 1.0)] = file
+        cached = {keys[key] for key in cache.contains(list(keys))}
+
+    parse = partial(parse_mediainfo, cache=cache, text=text)
+    results = {file: parse(file) for file in cached}
+    if pending := [file for file in files if file not in cached]:
+        workers = min(len(pending), workers or os.cpu_count() or 1)
+        if workers == 1:
+            results |= {file: parse(file) for file in pending}
+        else:
+            # Spawned, forking would copy the hashing threads of this process
+            with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                parsed = executor.map(parse, pending)
+                results |= dict(zip(pending, parsed, strict=True))
+
+    layouts = {file: _track_layout(results[file].tracks) for file in files}
+    common = Counter(
+        layout for file, layout in layouts.items() if results[file].tracks
+    ).most_common(1)
+    if not common:
+        return BatchMediaInfo(files[0], MediaInfoResult(), episodes=results)
+
+    layout = common[0][0]
+    matching = [file for file in files if layouts[file] == layout]
+    outliers = {
+        file: "could not be parsed"
+        if not results[file].tracks
+        else _layout_difference(layouts[file], layout)
+        for file in files
+        if layouts[file] != layout
+    }
+    file = matching[0]
+
+    return BatchMediaInfo(
+        file,
+        MediaInfoResult(
+            _batch_tracks([results[x].tracks for x in matching]), results[file].text
+        ),
+        outliers,
+        results,
+    )
 
-    return mediainfo.get("media", {}).get("track", [])
+
+def _track_layout(tracks: list[dict[str, str | int]]) -> tuple[tuple[str, ...], ...]:
+    """What the description shows of each track, without per-episode bitrates."""
+    return tuple(
+        (str(track["@type"]), *(str(track.get(x, "")) for x in LAYOUT_FIELDS[kind]))
+        for track in tracks
+        if (kind := track.get("@type")) in LAYOUT_FIELDS
+    )
+
+
+def _layout_difference(
+    layout: tuple[tuple[str, ...], ...], common: tuple[tuple[str, ...], ...]
+) -> str:
+    for kind, fields in LAYOUT_FIELDS.items():
+        tracks = [x for x in layout if x[0] == kind]
+        expected = [x for x in common if x[0] == kind]
+        if len(tracks) != len(expected):
+            plural = "" if len(tracks) == 1 else "s"
+            return (
+                f"{len(tracks)} {kind.lower()} track{plural} instead of {len(expected)}"
+            )
+
+        for num, (track, other) in enumerate(zip(tracks, expected, strict=True), 1):
+            if differ := [
+                name
+                for name, x, y in zip(fields, track[1:], other[1:], strict=True)
+                if x != y
+            ]:
+                return f"{kind.lower()} track {num} differs in {', '.join(differ)}"
+
+    return "track order differs"
+
+
+def _batch_tracks(
+    episodes: list[list[dict[str, str | int]]],
+) -> list[dict[str, str | int]]:
+    """
+    Tracks of the first episode, with the video stream size and duration of the
+    whole batch in `Batch_StreamSize` and `Batch_Duration` and the mean bitrate of
+    every audio track. All episodes share the track layout.
+    """
+    tracks = [dict(track) for track in episodes[0]]
+    for kind in ("Video", "Audio"):
+        for num, track in enumerate(x for x in tracks if x["@type"] == kind):
+            same = [
+                [x for x in episode if x["@type"] == kind][num] for episode in episodes
+            ]
+            with contextlib.suppress(KeyError, ValueError, ZeroDivisionError):
+                if kind == "Video":
+                    # Kept apart from the episode's own fields, the snapshots of
+                    # the episode still use its Duration
+                    track["Batch_StreamSize"], track["Batch_Duration"] = (
+                        sum(float(x["StreamSize"]) for x in same),
+                        sum(float(x["Duration"]) for x in same),
+                    )
+                else:
+                    bitrates = [float(x["BitRate"]) for x in same if x.get("BitRate")]
+                    track["BitRate"] = sum(bitrates) / len(bitrates)
+
+    return tracks
 
 
 def get_track_info(data: dict[str, str | int]) -> str:
@@ -90,7 +405,10 @@ def get_return(lang: str, track_name: str | None = None) -> str:
 def _process_video_track(info: dict[str, str | int]) -> str:
     v_bitrate = ""
     try:
-        b_raw = float(float(info["StreamSize"]) * 8 / float(info["Duration"]))
+        # The video bitrate over the whole batch for a batch description
+        size = info.get("Batch_StreamSize", info["StreamSize"])
+        duration = info.get("Batch_Duration", info["Duration"])
+        b_raw = float(float(size) * 8 / float(duration))
         if b_raw / 1000 < 10000:
             b = f"{b_raw / 1000:.0f} kbps"
         else:
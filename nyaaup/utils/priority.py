@@ -0,0 +1,30 @@
+import contextlib
+import os
+import threading
+
+from nyaaup.utils import which
+
+IDLE_NICE = 19
+
+
+def idle_command(command: list[str]) -> list[str]:
+    """Prefix `command` with ionice and nice, so it runs at idle I/O and CPU priority."""
+    prefix = []
+    if ionice := which("ionice"):
+        # -t: still run the command if the I/O class cannot be set
+        prefix += [str(ionice), "-c", "3", "-t"]
+    if nice := which("nice"):
+        prefix += [str(nice), "-n", str(IDLE_NICE)]
+
+    return prefix + command
+
+
+def lower_thread_priority() -> None:
+    """
+    Give the calling thread the lowest CPU priority.
+
+    Linux applies the nice value per thread, and the CFQ and BFQ schedulers
+    derive the I/O priority of a thread without an I/O class from it.
+    """
+    with contextlib.suppress(AttributeError, OSError):
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), IDLE_NICE)
@@ -0,0 +1,124 @@
+import time
+from pathlib import Path
+
+import humanize
+from rich import get_console
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    Progress,
+    TaskID,
+    TaskProgressColumn,
+    TextColumn,
+    TimeRemainingColumn,
+)
+
+from nyaaup.utils import CustomTransferSpeedColumn
+
+REFRESH_INTERVAL = 0.1
+PLAIN_INTERVAL = 10.0
+# Files announced with their own line before the rest are summarised
+MAX_FILE_LINES = 20
+
+
+def get_progress(console: Console | None = None) -> Progress:
+    return Progress(
+        TextColumn("[progress.description]{task.description}[/]"),
+        "•",
+        BarColumn(),
+        CustomTransferSpeedColumn(),
+        TaskProgressColumn(),
+        TextColumn("Time:"),
+        TimeRemainingColumn(elapsed_when_finished=True),
+        console=console,
+    )
+
+
+class HashProgress:
+    """
+    Progress of one hashing run, fed by the `(filepath, done, total)` callbacks.
+
+    Seen files are tracked in a set and only the first `MAX_FILE_LINES` get their
+    own line. The bar is redrawn at most every `REFRESH_INTERVAL` seconds; when
+    the output is not a terminal a plain line is printed every `PLAIN_INTERVAL`
+    seconds instead.
+    """
+
+    def __init__(
+        self,
+        description: str = "Creating torrent",
+        unit: int = 1,
+        files: int | None = None,
+        console: Console | None = None,
+    ):
+        self.description = description
+        # Bytes per unit of `done` and `total`, the piece size for piece counts
+        self.unit = unit
+        self.files = files
+        # Rich's global console, shared with the status spinners of the other stages
+        self.console = console or get_console()
+        self.live = self.console.is_terminal
+
+        self._seen: set[str] = set()
+        self._done = 0
+        self._total = 0
+        self._last = 0.0
+        self._start = 0.0
+        self._progress: Progress | None = None
+        self._task: TaskID | None = None
+
+    def __enter__(self) -> "HashProgress":
+        self._start = self._last = time.perf_counter()
+        if self.live:
+            self._progress = get_progress(self.console)
+            self._progress.start()
+            self._task = self._progress.add_task(
+                description=f"[bold magenta]{self.description}[not bold white]"
+            )
+
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        if self._progress:
+            self._draw()
+            self._progress.stop()
+        elif exc_type is None and self._total:
+            self._draw()
+
+    def update(self, filepath: str, done: int, total: int) -> None:
+        if filepath and filepath not in self._seen:
+            self._seen.add(filepath)
+            self._announce(filepath)
+
+        self._done, self._total = done * self.unit, total * self.unit
+
+        now = time.perf_counter()
+        interval = REFRESH_INTERVAL if self.live else PLAIN_INTERVAL
+        if now - self._last >= interval and done < total:
+            self._last = now
+            self._draw()
+
+    def _announce(self, filepath: str) -> None:
+        seen = len(self._seen)
+        if seen <= MAX_FILE_LINES:
+            self.console.print(
+                f"[bold white]Hashing [not bold white]{Path(filepath).name}..."
+            )
+        elif seen == MAX_FILE_LINES + 1:
+            more = f"{self.files - MAX_FILE_LINES} more" if self.files else "more"
+            self.console.print(f"[bold white]Hashing [not bold white]{more} files...")
+
+    def _draw(self) -> None:
+        if self._progress and self._task is not None:
+            self._progress.update(self._task, completed=self._done, total=self._total)
+            return
+
+        elapsed = time.perf_counter() - self._start
+        percent = self._done / self._total * 100 if self._total else 0
+        speed = humanize.naturalsize(self._done / elapsed if elapsed else 0, True)
+        self.console.print(
+            f"{self.description}: {percent:.0f}% "
+            f"({humanize.naturalsize(self._done, True)}/"
+            f"{humanize.naturalsize(self._total, True)}, {speed}/s)",
+            highlight=False,
+        )
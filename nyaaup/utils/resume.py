@@ -0,0 +1,127 @@
+import hashlib
+import math
+import time
+from pathlib import Path
+
+import niquests
+
+from nyaaup.utils.bencode import bdecode, bencode
+from nyaaup.utils.verify import TorrentFile, read_layout
+
+
+def info_hashes(metainfo: dict) -> tuple[bytes, bytes]:
+    """The v1 (SHA-1) and v2 (SHA-256) info hashes, empty if not that version."""
+    info = metainfo[b"info"]
+    encoded = bencode(info)
+
+    return (
+        hashlib.sha1(encoded).digest() if b"pieces" in info else b"",
+        hashlib.sha256(encoded).digest() if info.get(b"meta version") == 2 else b"",
+    )
+
+
+def fast_resume(torrent_file: Path, save_path: Path) -> bytes:
+    """
+    Build libtorrent resume data that marks every piece of `torrent_file` as
+    present in `save_path`, so the client starts seeding without a recheck.
+
+    File sizes and mtimes are those of the files on disk, the ones the torrent
+    was just hashed from, clients that compare them accept the data as is.
+    """
+    metainfo = bdecode(torrent_file.read_bytes())
+    layout = read_layout(torrent_file)
+    v1, v2 = info_hashes(metainfo)
+
+    if layout.pieces:
+        pieces = len(layout.pieces) // 20
+    else:
+        pieces = sum(math.ceil(file.size / layout.piece_size) for file in layout.files)
+
+    def file_size(file: TorrentFile) -> list[int]:
+        if file.pad:
+            return [0, 0]
+        path = (
+            save_path.joinpath(*file.parts)
+            if layout.single
+            else (save_path.joinpath(layout.name, *file.parts))
+        )
+        try:
+            return [file.size, int(path.stat().st_mtime)]
+        except OSError:
+            return [file.size, 0]
+
+    now = int(time.time())
+    trackers = metainfo.get(b"announce-list") or (
+        [[metainfo[b"announce"]]] if b"announce" in metainfo else []
+    )
+    resume = {
+        "file-format": "libtorrent resume file",
+        "file-version": 1,
+        "info-hash": v1 or bytes(20),
+        "name": layout.name,
+        "save_path": str(save_path),
+        "info": metainfo[b"info"],
+        "trackers": trackers,
+        "pieces": b"\x01" * pieces,
+        "file_sizes": [file_size(file) for file in layout.files],
+        "allocation": "sparse",
+        "paused": 0,
+        "auto_managed": 1,
+        "added_time": now,
+        "completed_time": now,
+    }
+    if v2:
+        resume["info-hash2"] = v2
+
+    return bencode(resume)
+
+
+def push_to_qbittorrent(
+    url: str,
+    torrent_file: Path,
+    save_path: Path,
+    credentials: str = "",
+    category: str = "",
+) -> None:
+    """
+    Add `torrent_file` to a qBittorrent WebUI with checking skipped, so seeding
+    starts right away. Raises `niquests.RequestException` or `ValueError`.
+    """
+    url = url.rstrip("/")
+    with niquests.Session() as client:
+        # qBittorrent rejects requests without a matching Referer
+        client.headers["Referer"] = url
+
+        if credentials:
+            username, _, password = credentials.partition(":")
+            res = client.post(
+                f"{url}/api/v2/auth/login",
+                data={"username": username, "password": password},
+                timeout=10,
+            )
+            res.raise_for_status()
+            if (res.text or "").strip() != "Ok.":
+                raise ValueError("qBittorrent login failed")
+
+        res = client.post(
+            f"{url}/api/v2/torrents/add",
+            files={
+                "torrents": (
+                    torrent_file.name,
+                    torrent_file.read_bytes(),
+                    "application/x-bittorrent",
+                )
+            },
+            data={
+                "savepath": str(save_path),
+                "category": category,
+                "skip_checking": "true",
+                # Keep the layout of the torrent, older versions use root_folder
+                "contentLayout": "Original",
+                "root_folder": "true",
+            },
+            timeout=30,
+        )
+        res.raise_for_status()
+        if (res.text or "").strip() == "Fails.":
+            raise ValueError("qBittorrent did not add the torrent")
@@ -0,0 +1,88 @@
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4")
+
+
+@dataclass(frozen=True)
+class ScannedFile:
+    path: Path
+    # Path inside the torrent, starting with the torrent name
+    parts: tuple[str, ...]
+    stat: os.stat_result
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+
+@dataclass
+class ScanResult:
+    """Files of an input path, filtered and ordered the way torf does it."""
+
+    path: Path
+    files: list[ScannedFile] = field(default_factory=list)
+    videos: list[Path] = field(default_factory=list)
+
+    @property
+    def is_file(self) -> bool:
+        return not self.path.is_dir()
+
+    @property
+    def total_size(self) -> int:
+        return sum(file.size for file in self.files)
+
+
+def scan(path: Path, exclude: str | None = None) -> ScanResult:
+    """
+    Walk `path` once with `os.scandir` and collect the torrent files.
+
+    Hidden and empty files and files whose path inside the torrent matches
+    `exclude` are skipped. `videos` lists the mkv/mp4 files at the top level.
+    """
+    pattern = re.compile(exclude) if exclude else None
+    result = ScanResult(path)
+
+    if path.is_file():
+        stat = path.stat()
+        if stat.st_size > 0 and not (pattern and pattern.search(path.name)):
+            result.files.append(ScannedFile(path, (path.name,), stat))
+        if path.suffix in VIDEO_EXTENSIONS:
+            result.videos.append(path)
+        return result
+
+    _scan_dir(path, (path.name,), pattern, result)
+    result.files.sort(key=lambda file: file.parts)
+    result.videos.sort()
+
+    return result
+
+
+def _scan_dir(
+    directory: Path,
+    parts: tuple[str, ...],
+    pattern: re.Pattern[str] | None,
+    result: ScanResult,
+) -> None:
+    prefix = str(Path(*parts))
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            path = directory / entry.name
+
+            if entry.is_dir():
+                if not entry.name.startswith("."):
+                    _scan_dir(path, (*parts, entry.name), pattern, result)
+                continue
+
+            if entry.name.startswith("."):
+                continue
+
+            if len(parts) == 1 and entry.name.endswith(VIDEO_EXTENSIONS):
+                result.videos.append(path)
+            if pattern and pattern.search(f"{prefix}{os.sep}{entry.name}"):
+                continue
+
+            if (stat := entry.stat()).st_size > 0:
+                result.files.append(ScannedFile(path, (*parts, entry.name), stat))
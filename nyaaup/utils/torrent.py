@@ -1,38 +1,149 @@
+import hashlib
 import math
+import os
+import re
 import subprocess
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
+from typing import TypeVar
 
 import niquests
-from rich.progress import (
-    BarColumn,
-    Progress,
-    TaskProgressColumn,
-    TextColumn,
-    TimeRemainingColumn,
-)
+import orjson
 from torf import Torrent
 
-from nyaaup.utils import CustomTransferSpeedColumn, which
+from nyaaup.utils import which
+from nyaaup.utils.bencode import bdecode, bencode
+from nyaaup.utils.cache import DiskCache, pack, unpack
 from nyaaup.utils.collections import as_list
+from nyaaup.utils.hasher import (
+    FileHasher,
+    FileHashes,
+    HashCancelled,
+    PieceHasher,
+    ReadOptions,
+)
 from nyaaup.utils.logging import eprint, iprint, wprint
+from nyaaup.utils.priority import idle_command
+from nyaaup.utils.progress import HashProgress, get_progress
+from nyaaup.utils.scanner import ScanResult, scan
+from nyaaup.utils.verify import compare_files, read_layout, verify_pieces
+
+EXCLUDE_REGEX = r".*\.(ffindex|jpg|nfo|png|torrent|txt|json)$"
+# Percentage in a torrenttools progress line, which may contain ANSI escapes
+TORRENTTOOLS_PROGRESS = re.compile(rb"(\d{1,3}(?:\.\d+)?)\s*%")
+# 1-padded is v1 with every file aligned to a piece by BEP 47 pad files
+TORRENT_VERSIONS = ("1", "1-padded", "2", "hybrid")
+
+T = TypeVar("T")
+
+
+PUBLIC_TRACKERS_URL = (
+    "https://raw.githubusercontent.com/ngosang/trackerslist/master/trackers_best.txt"
+)
+PUBLIC_TRACKERS_TTL = 24 * 60 * 60  # 1 day
+# Inputs from this size on are hashed natively with `torrent_creator: torf`, so
+# they are checkpointed. torf hashes in one call and writes the same pieces.
+RESUMABLE_SIZE = 1024**3  # 1 GiB
+
+
+def _fetch_public_trackers(retries: int = 5) -> list[str]:
+    res = niquests.get(PUBLIC_TRACKERS_URL, retries=retries, timeout=10)
+    res.raise_for_status()
+
+    return list(filter(None, (x.strip() for x in (res.text or "").splitlines())))
+
+
+def _refresh_public_trackers(cache_file: Path, retries: int = 5) -> list[str]:
+    """Fetch the tracker list and store it in `cache_file`."""
+    trackers = _fetch_public_trackers(retries)
+    if trackers:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(orjson.dumps({"fetched": time.time(), "trackers": trackers}))
+        tmp.replace(cache_file)
+
+    return trackers
+
+
+def _refresh_public_trackers_quietly(cache_file: Path) -> None:
+    # The cached list stays in use if the refresh fails
+    with suppress(niquests.RequestException, OSError):
+        _refresh_public_trackers(cache_file)
 
 
 @lru_cache(maxsize=1)
-def get_public_trackers() -> list[str]:
+def get_public_trackers(
+    cache_dir: Path | None = None, ttl: int = PUBLIC_TRACKERS_TTL
+) -> list[str]:
+    """
+    Return the public tracker list, from the disk cache in `cache_dir` if present.
+
+    A cached list older than `ttl` seconds is returned as is and refreshed in the
+    background for the next run; it is only fetched in the foreground when
+    nothing is cached yet.
+    """
+    cache_file = cache_dir / "public_trackers.json" if cache_dir else None
+
+    cached = None
+    if cache_file and cache_file.is_file():
+        with suppress(OSError, orjson.JSONDecodeError):
+            cached = orjson.loads(cache_file.read_bytes())
+
+    if cached and cached.get("trackers"):
+        if time.time() - cached.get("fetched", 0) > ttl:
+            threading.Thread(
+                target=_refresh_public_trackers_quietly, args=(cache_file,), daemon=True
+            ).start()
+        return list(cached["trackers"])
+
     try:
-        res = niquests.get(
-            "https://raw.githubusercontent.com/ngosang/trackerslist"
-            "/master/trackers_best.txt",
-            retries=5,
-        )
-        res.raise_for_status()
-        return list(filter(None, res.text.splitlines()))
-    except niquests.RequestException as e:
+        if cache_file:
+            return _refresh_public_trackers(cache_file, retries=2)
+        return _fetch_public_trackers()
+    except (niquests.RequestException, OSError) as e:
         eprint(str(e))
         return []
 
 
+@dataclass
+class TorrentVariant:
+    """Another copy of a torrent with different trackers or a source tag."""
+
+    path: Path
+    announces: list[str]
+    source: str | None = None
+
+
+def write_variant(torrent_file: Path, variant: TorrentVariant) -> None:
+    """
+    Write `variant` from the hashed `torrent_file`, trackers are set the way torf
+    does it. A source tag changes the info hash but not the pieces, so nothing
+    is hashed again.
+    """
+    metainfo = bdecode(torrent_file.read_bytes())
+    metainfo.pop(b"announce", None)
+    metainfo.pop(b"announce-list", None)
+    if announces := list(dict.fromkeys(as_list(variant.announces))):
+        metainfo[b"announce"] = announces[0]
+        if len(announces) > 1:
+            metainfo[b"announce-list"] = [[url] for url in announces]
+
+    if variant.source:
+        metainfo[b"info"][b"source"] = variant.source
+    else:
+        metainfo[b"info"].pop(b"source", None)
+
+    tmp = variant.path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(bencode(metainfo))
+    tmp.replace(variant.path)
+
+
 def create_torrent(
     name: str,
     filename: Path,
@@ -40,123 +151,1064 @@ def create_torrent(
     announces: list[str],
     overwrite: bool,
     torrent_tool: str,
+    hash_cache: DiskCache | None = None,
+    version: str = "1",
+    scanned: ScanResult | None = None,
+    read_options: ReadOptions | None = None,
+    verify: str = "off",
+    checkpoint_interval: float = 60,
+    threads: int | None = None,
+    variants: Sequence[TorrentVariant] = (),
+    cancel: threading.Event | None = None,
 ) -> bool:
+    """
+    Create `{name}.torrent` in `cache_dir` with `torrent_tool`, then write the
+    `variants` from it without hashing again.
+
+    Setting `cancel` from another thread stops hashing with `HashCancelled`,
+    after the hashed pieces are saved to the checkpoint.
+    """
+    if torrent_tool == "torrenttools" and version == "1-padded":
+        wprint("torrenttools cannot pad v1 torrents, using the native creator")
+        torrent_tool = "native"
+    elif torrent_tool == "torrenttools" and (
+        reason := torrenttools_unsupported(read_options)
+    ):
+        wprint(f"torrenttools cannot {reason}, using the native creator")
+        torrent_tool = "native"
+
     if torrent_tool == "torrenttools":
         result: bool = create_torrent_torrenttools(
-            name, filename, cache_dir, announces, overwrite
+            name,
+            filename,
+            cache_dir,
+            announces,
+            overwrite,
+            threads=threads,
+            version=version,
+            scanned=scanned,
+            read_options=read_options,
+            verify=verify,
+            cancel=cancel,
+        )
+    elif torrent_tool == "native":
+        result = create_torrent_native(
+            name,
+            filename,
+            cache_dir,
+            announces,
+            overwrite,
+            threads=threads,
+            hash_cache=hash_cache,
+            version=version,
+            scanned=scanned,
+            read_options=read_options,
+            verify=verify,
+            checkpoint_interval=checkpoint_interval,
+            cancel=cancel,
         )
     else:
-        result = create_torrent_torf(name, filename, cache_dir, announces, overwrite)
+        result = create_torrent_torf(
+            name,
+            filename,
+            cache_dir,
+            announces,
+            overwrite,
+            threads=threads,
+            hash_cache=hash_cache,
+            version=version,
+            scanned=scanned,
+            read_options=read_options,
+            verify=verify,
+            checkpoint_interval=checkpoint_interval,
+            cancel=cancel,
+        )
+
+    if result:
+        for variant in variants:
+            write_variant(Path(f"{cache_dir}/{name}.torrent"), variant)
 
     return result
 
 
+def torrenttools_unsupported(read_options: ReadOptions | None) -> str | None:
+    """What of `read_options` torrenttools cannot do, None if it honours them all."""
+    if read_options and read_options.bwlimit:
+        return "limit its reads"
+    if read_options and (read_options.drop_cache or read_options.direct_io):
+        return "drop or bypass the page cache"
+
+    return None
+
+
 def create_torrent_torrenttools(
-    name: str, filename: Path, cache_dir: Path, announces: list[str], overwrite: bool
+    name: str,
+    filename: Path,
+    cache_dir: Path,
+    announces: list[str],
+    overwrite: bool,
+    threads: int | None = None,
+    version: str = "1",
+    scanned: ScanResult | None = None,
+    read_options: ReadOptions | None = None,
+    verify: str = "off",
+    cancel: threading.Event | None = None,
 ) -> bool:
+    """
+    Create the torrent with torrenttools, with the same piece size, trackers and
+    thread count as the other creators.
+    """
     torrent_file = Path(f"{cache_dir}/{name}.torrent")
 
-    if torrent_file.exists():
-        if overwrite:
-            wprint("Torrent file exists, removing...")
-            torrent_file.unlink()
-        else:
-            iprint("Using existing torrent file...")
-            return True
+    if _check_existing(
+        torrent_file, overwrite, filename, scanned, verify, threads, read_options
+    ):
+        return True
 
     iprint("Creating torrent...", 0)
 
     if not (executable := which("torrenttools")):
         eprint("torrenttools not found", fatal=True)
 
-    subprocess.run(
-        [
-            executable,
-            "create",
-            str(filename),
-            "--no-created-by",
-            "--no-creation-date",
-            "--exclude",
-            r".*\.(ffindex|jpg|nfo|png|torrent|txt|json)$",
-            "--announce",
-            " ".join(as_list(announces)),
-            "--piece-size",
-            "16M",
-            "--output",
-            str(torrent_file),
-        ],
-        check=True,
-    )
-    print()
+    scanned = scanned or scan(filename, EXCLUDE_REGEX)
+    command = [
+        str(executable),
+        "create",
+        str(filename),
+        "--no-created-by",
+        "--no-creation-date",
+        "--exclude",
+        EXCLUDE_REGEX,
+        "--piece-size",
+        f"{get_piece_size(scanned.total_size) // 1024}K",
+        "--threads",
+        str(threads or os.cpu_count() or 1),
+        "--protocol",
+        version,
+        "--output",
+        str(torrent_file),
+    ]
+    if announces := as_list(announces):
+        # One url per value, torrenttools puts each in its own tier like torf
+        command += ["--announce", *announces]
+    if read_options and read_options.idle:
+        command = idle_command(command)
+
+    _run_torrenttools(command, scanned.total_size, len(scanned.files), cancel)
 
     return torrent_file.exists()
 
 
-def create_torrent_torf(
-    name: str, filename: Path, cache_dir: Path, announces: list[str], overwrite: bool
+def _run_torrenttools(
+    command: list[str],
+    total_size: int,
+    files: int,
+    cancel: threading.Event | None = None,
+) -> None:
+    """Run torrenttools and draw its progress output with our progress bar."""
+    output: list[str] = []
+    with (
+        HashProgress(files=files) as progress,
+        subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        ) as process,
+    ):
+        assert process.stdout
+        buffer = b""
+        while chunk := process.stdout.read1():
+            if cancel and cancel.is_set():
+                process.terminate()
+                raise HashCancelled
+            *lines, buffer = re.split(rb"[\r\n]", buffer + chunk)
+            for line in lines:
+                if match := TORRENTTOOLS_PROGRESS.search(line):
+                    percent = min(100.0, float(match[1]))
+                    progress.update("", int(total_size * percent / 100), total_size)
+                elif line := line.decode(errors="replace").strip():
+                    output.append(line)
+        if not process.wait():
+            progress.update("", total_size, total_size)
+
+    if process.returncode:
+        eprint("\n".join(["torrenttools failed:", *output[-20:]]))
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def get_piece_size(total_bytes: int) -> int:
+    """Piece size for about 1500 pieces, between 256 KiB and 16 MiB."""
+    target_pieces = 1500
+    exponent = max(18, min(24, round(math.log2(max(1, total_bytes) / target_pieces))))
+
+    return 2**exponent
+
+
+def _init_torrent(
+    filename: Path, announces: list[str], scanned: ScanResult | None = None
+) -> Torrent:
+    """
+    Build the torrent from a single scan of `filename` instead of letting torf
+    walk, stat and filter the tree again.
+    """
+    scanned = scanned or scan(filename, EXCLUDE_REGEX)
+
+    torrent = Torrent(trackers=announces, creation_date=None, created_by=None)
+    info = torrent.metainfo["info"]
+    info["name"] = filename.name
+    if scanned.files and scanned.is_file:
+        info["length"] = scanned.total_size
+    elif scanned.files:
+        info["files"] = [
+            {"length": file.size, "path": list(file.parts[1:])} for file in scanned.files
+        ]
+    # Same as the `path` setter without reading the file list from disk again
+    torrent._path = filename
+    torrent.piece_size = get_piece_size(scanned.total_size)
+
+    return torrent
+
+
+def _check_existing(
+    torrent_file: Path,
+    overwrite: bool,
+    filename: Path | None = None,
+    scanned: ScanResult | None = None,
+    verify: str = "off",
+    threads: int | None = None,
+    read_options: ReadOptions | None = None,
+    hash_cache: DiskCache | None = None,
 ) -> bool:
-    torrent_file = Path(f"{cache_dir}/{name}.torrent")
+    """
+    Return True if an existing torrent file should be reused.
 
+    With `verify` set to sample or full, the torrent is only reused if its file
+    list matches `filename` and the sampled (or all) pieces hash the same.
+    Otherwise the cached hashes of `filename` are dropped as well, they were
+    keyed by the same sizes and mtimes and would give back the same torrent.
+    """
     if torrent_file.is_file():
         if overwrite:
             wprint("Torrent file exists, removing...")
             torrent_file.unlink()
+        elif (
+            verify != "off"
+            and filename
+            and (
+                reason := _verify_existing(
+                    torrent_file, filename, scanned, verify, threads, read_options
+                )
+            )
+        ):
+            wprint(f"Existing torrent does not match: {reason}, recreating...")
+            torrent_file.unlink()
+            _forget_hashes(torrent_file, filename, scanned, hash_cache)
         else:
             iprint("Using existing torrent file...")
             return True
 
-    iprint("Creating torrent...", 0)
+    return False
 
-    piece_size: int = 2**18
 
-    if filename.is_file():
-        total_bytes: int = filename.stat().st_size
-    else:
-        total_bytes = sum(f.stat().st_size for f in filename.rglob("*") if f.is_file())
+def _forget_hashes(
+    torrent_file: Path,
+    filename: Path,
+    scanned: ScanResult | None,
+    hash_cache: DiskCache | None,
+) -> None:
+    """Drop the checkpoint and the cached piece and file hashes of `filename`."""
+    torrent_file.with_name(f"{torrent_file.name}.part").unlink(missing_ok=True)
+    if not hash_cache:
+        return
 
-    target_pieces = 1500
-    exponent = max(18, min(24, round(math.log2(total_bytes / target_pieces))))
-    piece_size = 2**exponent
+    scanned = scanned or scan(filename, EXCLUDE_REGEX)
+    stats = [file.stat for file in scanned.files]
+    torrent = _init_torrent(filename, [], scanned)
+    hash_cache.delete(
+        f"pieces:{_pieces_cache_key(torrent, stats)}",
+        f"layout:{filename.absolute()}",
+        # Every piece size the aligned torrents may have hashed a file with
+        *(
+            _file_hashes_key(stat, 2**exponent)
+            for stat in stats
+            for exponent in range(14, 25)
+        ),
+    )
 
-    torrent = Torrent(
-        filename,
-        trackers=announces,
-        creation_date=None,
-        created_by=None,
-        piece_size=piece_size,
-        exclude_regexs=[r".*\.(ffindex|jpg|nfo|png|torrent|txt|json)$"],
+
+def _verify_existing(
+    torrent_file: Path,
+    filename: Path,
+    scanned: ScanResult | None,
+    verify: str,
+    threads: int | None,
+    read_options: ReadOptions | None,
+) -> str | None:
+    """Return why `torrent_file` cannot be reused, None if it matches the files."""
+    try:
+        layout = read_layout(torrent_file)
+    except (OSError, ValueError) as e:
+        return str(e)
+
+    scanned = scanned or scan(filename, EXCLUDE_REGEX)
+    if reason := compare_files(layout, filename, scanned):
+        return reason
+
+    iprint(f"Verifying existing torrent ({verify})...", 0)
+    try:
+        return _with_progress(
+            layout.piece_size,
+            lambda callback: verify_pieces(
+                layout, filename, verify, threads, read_options, callback
+            ),
+            description="Verifying torrent",
+        )
+    except OSError as e:
+        return str(e)
+
+
+def _torrent_paths(torrent: Torrent) -> list[Path]:
+    """Paths of the files in `torrent`, without the quadratic `Torrent.filepaths`."""
+    info = torrent.metainfo["info"]
+    if "files" not in info:
+        return [Path(torrent.path)]
+
+    return [Path(torrent.path, *file["path"]) for file in info["files"]]
+
+
+def _pieces_cache_key(torrent: Torrent, stats: list[os.stat_result]) -> str:
+    """Key piece hashes by piece size and (path, size, mtime_ns, inode) of every file."""
+    identities = [
+        [str(filepath.absolute()), stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        for filepath, stat in zip(_torrent_paths(torrent), stats, strict=True)
+    ]
+
+    return hashlib.sha256(orjson.dumps([torrent.piece_size, identities])).hexdigest()
+
+
+def _file_identities(stats: list[os.stat_result]) -> list[list[int]]:
+    return [[stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns] for stat in stats]
+
+
+def _piece_segments(files: list[list[int]], piece_size: int) -> list[tuple]:
+    """
+    Describe every piece as the (file identity, offset, length) ranges it covers.
+
+    Two pieces with equal segments hash the same bytes, whatever the position
+    of the files in the torrent.
+    """
+    segments: list[tuple] = []
+    current: list[tuple] = []
+    room = piece_size
+
+    for identity in files:
+        size = identity[2]
+        offset = 0
+        while offset < size:
+            length = min(room, size - offset)
+            current.append((*identity, offset, length))
+            offset += length
+            room -= length
+            if not room:
+                segments.append(tuple(current))
+                current = []
+                room = piece_size
+
+    if current:
+        segments.append(tuple(current))
+
+    return segments
+
+
+def _load_cached_pieces(
+    torrent: Torrent, hash_cache: DiskCache | None, stats: list[os.stat_result]
+) -> dict[int, bytes]:
+    """
+    Return the piece hashes that are still valid for `torrent`.
+
+    If the content is unchanged, every piece comes from the cache. Otherwise the
+    pieces of the previous torrent of the same path that cover only unchanged
+    files are reused, so adding an episode to a batch only hashes the new pieces.
+    """
+    if not hash_cache:
+        return {}
+
+    pieces = hash_cache.get(f"pieces:{_pieces_cache_key(torrent, stats)}")
+    if pieces and len(pieces) == torrent.pieces * 20:
+        return {
+            index: pieces[index * 20 : index * 20 + 20] for index in range(torrent.pieces)
+        }
+
+    if not (layout := hash_cache.get(f"layout:{Path(torrent.path).absolute()}")):
+        return {}
+
+    previous, pieces = unpack(layout)
+    if previous["piece_size"] != torrent.piece_size:
+        return {}
+
+    old_segments = {
+        segment: index
+        for index, segment in enumerate(
+            _piece_segments(previous["files"], previous["piece_size"])
+        )
+    }
+    new_segments = _piece_segments(_file_identities(stats), torrent.piece_size)
+
+    return {
+        index: pieces[old * 20 : old * 20 + 20]
+        for index, segment in enumerate(new_segments)
+        if (old := old_segments.get(segment)) is not None
+    }
+
+
+def _store_cached_pieces(
+    torrent: Torrent, hash_cache: DiskCache | None, stats: list[os.stat_result]
+) -> None:
+    if not hash_cache or not (pieces := torrent.metainfo["info"].get("pieces")):
+        return
+
+    hash_cache.set(f"pieces:{_pieces_cache_key(torrent, stats)}", pieces)
+
+    hash_cache.set(
+        f"layout:{Path(torrent.path).absolute()}",
+        pack(
+            {"piece_size": torrent.piece_size, "files": _file_identities(stats)},
+            pieces,
+        ),
+    )
+
+
+def _with_progress(
+    piece_size: int,
+    run: Callable[[Callable[[str, int, int], None]], T],
+    files: int | None = None,
+    description: str = "Creating torrent",
+) -> T:
+    """Call `run` with a progress callback drawing the hashing progress bar."""
+    with HashProgress(description, unit=piece_size, files=files) as progress:
+        return run(progress.update)
+
+
+def _hash_pieces(
+    torrent: Torrent,
+    scanned: ScanResult,
+    indices: list[int],
+    threads: int | None = None,
+    read_options: ReadOptions | None = None,
+    checkpoint: Callable[[dict[int, bytes]], None] | None = None,
+    checkpoint_interval: float = 60,
+    cancel: threading.Event | None = None,
+) -> dict[int, bytes]:
+    hasher = PieceHasher(
+        [(file.path, file.size) for file in scanned.files],
+        torrent.piece_size,
+        threads=threads,
+        options=read_options,
+        cancel=cancel,
+    )
+
+    return _with_progress(
+        torrent.piece_size,
+        lambda callback: hasher.hash(
+            indices,
+            callback=callback,
+            interval=1,
+            checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+        ),
+        files=len(scanned.files),
+    )
+
+
+def _load_checkpoint(checkpoint_file: Path, key: str, pieces: int) -> dict[int, bytes]:
+    """Return the piece hashes saved by an interrupted run over the same files."""
+    try:
+        header, payload = unpack(checkpoint_file.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+    if header.get("key") != key or header.get("pieces") != pieces:
+        return {}
+
+    return {
+        index: payload[pos * 20 : pos * 20 + 20]
+        for pos, index in enumerate(header["indices"])
+    }
+
+
+def _save_checkpoint(
+    checkpoint_file: Path, key: str, pieces: int, hashes: dict[int, bytes]
+) -> None:
+    indices = sorted(hashes)
+    tmp = checkpoint_file.with_name(f"{checkpoint_file.name}.tmp")
+    tmp.write_bytes(
+        pack(
+            {"key": key, "pieces": pieces, "indices": indices},
+            b"".join(hashes[index] for index in indices),
+        )
     )
+    tmp.replace(checkpoint_file)
 
-    with Progress(
-        TextColumn("[progress.description]{task.description}[/]"),
-        "•",
-        BarColumn(),
-        CustomTransferSpeedColumn(),
-        TaskProgressColumn(),
-        TextColumn("Time:"),
-        TimeRemainingColumn(elapsed_when_finished=True),
-    ) as progress:
+
+def _needs_native_reads(read_options: ReadOptions | None) -> bool:
+    """torf cannot drop or bypass the page cache or limit its reads, the native hasher can."""
+    return bool(
+        read_options
+        and (
+            read_options.drop_cache
+            or read_options.direct_io
+            or read_options.bwlimit
+            or read_options.idle
+        )
+    )
+
+
+def _generate_torf(
+    torrent: Torrent,
+    threads: int | None = None,
+    cancel: threading.Event | None = None,
+) -> None:
+    files = len(torrent.metainfo["info"].get("files", [])) or 1
+
+    def update(_: Torrent, *args) -> bool | None:
+        progress.update(*args)
+        # torf stops hashing when the callback returns anything but None
+        return True if cancel and cancel.is_set() else None
+
+    with HashProgress(unit=torrent.piece_size, files=files) as progress:
+        if not torrent.generate(threads=threads, callback=update, interval=1):
+            raise HashCancelled
+
+
+def _file_hashes_key(stat: os.stat_result, piece_size: int) -> str:
+    return f"files:{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}:{piece_size}"
+
+
+def _load_file_hashes(
+    hash_cache: DiskCache | None, key: str, v1: bool
+) -> FileHashes | None:
+    if not hash_cache or not (value := hash_cache.get(key)):
+        return None
+
+    header, payload = unpack(value)
+    if v1 and not header["v1"]:
+        return None
+
+    offsets = header["offsets"]
+    pieces, tail, layer, root = (
+        payload[offsets[num] : offsets[num + 1]] for num in range(4)
+    )
+
+    return FileHashes(pieces=pieces, tail=tail, piece_layer=layer, root=root)
+
+
+def _store_file_hashes(
+    hash_cache: DiskCache | None, key: str, hashes: FileHashes, v1: bool
+) -> None:
+    if not hash_cache:
+        return
+
+    parts = [hashes.pieces, hashes.tail, hashes.piece_layer, hashes.root]
+    offsets = [0]
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+
+    hash_cache.set(key, pack({"v1": v1, "offsets": offsets}, b"".join(parts)))
+
+
+def _aligned_piece_size(
+    scanned: ScanResult, hash_cache: DiskCache | None, default: int
+) -> int:
+    """
+    Piece size with the most bytes of `scanned` already hashed per file, so an
+    episode hashed on its own is reused in a batch with a larger default size.
+    """
+    if not hash_cache or not scanned.files:
+        return default
+
+    sizes = [2**exponent for exponent in range(18, 25)]
+    keys = {
+        size: [_file_hashes_key(file.stat, size) for file in scanned.files]
+        for size in sizes
+    }
+    found = hash_cache.contains([key for size in sizes for key in keys[size]])
+    cached = {
+        size: sum(
+            file.size
+            for file, key in zip(scanned.files, keys[size], strict=True)
+            if key in found
+        )
+        for size in sizes
+    }
+    best = max(sizes, key=lambda size: (cached[size], size == default))
+
+    return best if cached[best] else default
+
+
+def _write_aligned_torrent(
+    torrent: Torrent,
+    scanned: ScanResult,
+    torrent_file: Path,
+    v1: bool,
+    v2: bool,
+    threads: int | None = None,
+    hash_cache: DiskCache | None = None,
+    read_options: ReadOptions | None = None,
+    cancel: threading.Event | None = None,
+) -> None:
+    """
+    Write a torrent whose files all start on a piece boundary: v2 (BEP 52),
+    hybrid, or v1 with BEP 47 pad files.
+
+    Per-file merkle trees and piece-aligned v1 hashes are stored in the hash
+    cache by file identity, so a file hashed once for any of these torrents is
+    not read again for another one with the same piece size, like an episode
+    that is later uploaded in a batch.
+    """
+    piece_size = torrent.piece_size
+    entries = sorted(
+        (
+            (
+                file,
+                file.size,
+                file.parts[1:] if torrent.mode == "multifile" else file.parts,
+            )
+            for file in scanned.files
+        ),
+        key=lambda entry: [part.encode() for part in entry[2]],
+    )
+    keys = [_file_hashes_key(file.stat, piece_size) for file, _, _ in entries]
+    hashes = [_load_file_hashes(hash_cache, key, v1) for key in keys]
+
+    if missing := [num for num, cached in enumerate(hashes) if cached is None]:
+        if len(missing) < len(entries):
+            iprint(f"Reusing cached hashes of {len(entries) - len(missing)} files...", 0)
+        hasher = FileHasher(
+            piece_size, threads=threads, v1=v1, options=read_options, cancel=cancel
+        )
+        new = _with_progress(
+            piece_size,
+            lambda callback: hasher.hash(
+                [(entries[num][0].path, entries[num][1]) for num in missing],
+                callback=callback,
+                interval=1,
+            ),
+            files=len(missing),
+        )
+        for num, file_hashes in zip(missing, new, strict=True):
+            hashes[num] = file_hashes
+            _store_file_hashes(hash_cache, keys[num], file_hashes, v1)
+    else:
+        iprint("Using cached piece hashes...", 0)
+
+    info: dict = {"name": torrent.name, "piece length": piece_size}
+    piece_layers = {}
+
+    if v2:
+        file_tree: dict = {}
+        for (_, size, parts), file_hashes in zip(entries, hashes, strict=True):
+            assert file_hashes
+            node = file_tree
+            for part in parts:
+                node = node.setdefault(part, {})
+            node[""] = {"length": size, "pieces root": file_hashes.root}
+            if file_hashes.piece_layer:
+                piece_layers[file_hashes.root] = file_hashes.piece_layer
+        info["file tree"] = file_tree
+        info["meta version"] = 2
+
+    if v1:
+        pieces = []
         files = []
+        for num, ((_, size, parts), file_hashes) in enumerate(
+            zip(entries, hashes, strict=True)
+        ):
+            assert file_hashes
+            last = num == len(entries) - 1
+            if last and file_hashes.tail:
+                pieces.append(file_hashes.pieces[:-20] + file_hashes.tail)
+            else:
+                pieces.append(file_hashes.pieces)
 
-        def update_progress(
-            torrent: Torrent, filepath: str, pieces_done: int, pieces_total: int
-        ) -> None:
-            if filepath not in files:
-                progress.console.print(
-                    f"[bold white]Hashing [not bold white]{Path(filepath).name}..."
-                )
-                files.append(filepath)
+            files.append({"length": size, "path": list(parts)})
+            if not last and (pad := -size % piece_size):
+                files.append({"attr": "p", "length": pad, "path": [".pad", str(pad)]})
+
+        if torrent.mode == "singlefile":
+            info["length"] = entries[0][1]
+        else:
+            info["files"] = files
+        info["pieces"] = b"".join(pieces)
+
+    metainfo = {key: value for key, value in torrent.metainfo.items() if key != "info"}
+    metainfo["info"] = info
+    if piece_layers:
+        metainfo["piece layers"] = piece_layers
+
+    torrent_file.write_bytes(bencode(metainfo))
+
+
+def _create_torrent(
+    name: str,
+    filename: Path,
+    cache_dir: Path,
+    announces: list[str],
+    overwrite: bool,
+    native: bool,
+    threads: int | None = None,
+    hash_cache: DiskCache | None = None,
+    version: str = "1",
+    scanned: ScanResult | None = None,
+    read_options: ReadOptions | None = None,
+    verify: str = "off",
+    checkpoint_interval: float = 60,
+    cancel: threading.Event | None = None,
+) -> bool:
+    torrent_file = Path(f"{cache_dir}/{name}.torrent")
+
+    if _check_existing(
+        torrent_file,
+        overwrite,
+        filename,
+        scanned,
+        verify,
+        threads,
+        read_options,
+        hash_cache,
+    ):
+        return True
+
+    iprint("Creating torrent...", 0)
 
-            progress.update(
-                create,
-                completed=pieces_done * torrent.piece_size,
-                total=pieces_total * torrent.piece_size,
+    scanned = scanned or scan(filename, EXCLUDE_REGEX)
+    torrent = _init_torrent(filename, announces, scanned)
+
+    if version != "1":
+        torrent.piece_size = _aligned_piece_size(scanned, hash_cache, torrent.piece_size)
+        _write_aligned_torrent(
+            torrent,
+            scanned,
+            torrent_file,
+            version != "2",
+            version in ("2", "hybrid"),
+            threads,
+            hash_cache,
+            read_options,
+            cancel,
+        )
+        return True
+
+    stats = [file.stat for file in scanned.files]
+    hashes = _load_cached_pieces(torrent, hash_cache, stats)
+
+    # Pieces hashed by an interrupted run over the same files
+    key = _pieces_cache_key(torrent, stats)
+    checkpoint_file = torrent_file.with_name(f"{torrent_file.name}.part")
+    resumed = {}
+    if checkpoint_interval and (
+        resumed := _load_checkpoint(checkpoint_file, key, torrent.pieces)
+    ):
+        iprint(f"Resuming from checkpoint: {len(resumed)}/{torrent.pieces} pieces...", 0)
+        hashes.update(resumed)
+
+    def checkpoint(done: dict[int, bytes]) -> None:
+        _save_checkpoint(checkpoint_file, key, torrent.pieces, hashes | done)
+
+    if len(hashes) == torrent.pieces:
+        iprint("Using cached piece hashes...", 0)
+    elif (
+        hashes
+        or native
+        or _needs_native_reads(read_options)
+        or (checkpoint_interval and scanned.total_size >= RESUMABLE_SIZE)
+    ):
+        if hashes and not resumed:
+            iprint(f"Reusing {len(hashes)}/{torrent.pieces} cached pieces...", 0)
+        missing = [index for index in range(torrent.pieces) if index not in hashes]
+        hashes.update(
+            _hash_pieces(
+                torrent,
+                scanned,
+                missing,
+                threads,
+                read_options,
+                checkpoint=checkpoint if checkpoint_interval else None,
+                checkpoint_interval=checkpoint_interval,
+                cancel=cancel,
             )
+        )
+    else:
+        _generate_torf(torrent, threads, cancel)
 
-        create = progress.add_task(
-            description="[bold magenta]Creating torrent[not bold white]"
+    if hashes:
+        torrent.metainfo["info"]["pieces"] = b"".join(
+            hashes[index] for index in range(torrent.pieces)
         )
-        torrent.generate(callback=update_progress, interval=1)
-        torrent.write(torrent_file)
+
+    _store_cached_pieces(torrent, hash_cache, stats)
+    torrent.write(torrent_file)
+    checkpoint_file.unlink(missing_ok=True)
 
     return True
+
+
+def create_torrent_torf(
+    name: str,
+    filename: Path,
+    cache_dir: Path,
+    announces: list[str],
+    overwrite: bool,
+    threads: int | None = None,
+    hash_cache: DiskCache | None = None,
+    version: str = "1",
+    scanned: ScanResult | None = None,
+    read_options: ReadOptions | None = None,
+    verify: str = "off",
+    checkpoint_interval: float = 60,
+    cancel: threading.Event | None = None,
+) -> bool:
+    return _create_torrent(
+        name,
+        filename,
+        cache_dir,
+        announces,
+        overwrite,
+        False,
+        threads,
+        hash_cache=hash_cache,
+        version=version,
+        scanned=scanned,
+        read_options=read_options,
+        verify=verify,
+        checkpoint_interval=checkpoint_interval,
+        cancel=cancel,
+    )
+
+
+def create_torrent_native(
+    name: str,
+    filename: Path,
+    cache_dir: Path,
+    announces: list[str],
+    overwrite: bool,
+    threads: int | None = None,
+    hash_cache: DiskCache | None = None,
+    version: str = "1",
+    scanned: ScanResult | None = None,
+    read_options: ReadOptions | None = None,
+    verify: str = "off",
+    checkpoint_interval: float = 60,
+    cancel: threading.Event | None = None,
+) -> bool:
+    """
+    Create the same torrent as `create_torrent_torf`, hashing the pieces with
+    `PieceHasher` instead of torf's single reader thread.
+    """
+    return _create_torrent(
+        name,
+        filename,
+        cache_dir,
+        announces,
+        overwrite,
+        True,
+        threads,
+        hash_cache,
+        version,
+        scanned,
+        read_options,
+        verify,
+        checkpoint_interval,
+        cancel,
+    )
+
+
+def get_device(path: Path) -> int:
+    return path.stat().st_dev
+
+
+def is_rotational(device: int) -> bool | None:
+    """Whether the block device behind `device` spins, None if unknown (not Linux)."""
+    block = Path(f"/sys/dev/block/{os.major(device)}:{os.minor(device)}")
+    for queue in (block / "queue", block.resolve().parent / "queue"):
+        with suppress(OSError, ValueError):
+            return (queue / "rotational").read_text().strip() == "1"
+
+    return None
+
+
+def group_by_device(paths: list[Path]) -> list[list[Path]]:
+    """
+    Split `paths` into queues that can be hashed concurrently.
+
+    Inputs on a rotational (or unknown) device share one queue, so the disk reads
+    one stream at a time; inputs on SSDs get a queue each.
+    """
+    devices: dict[int, list[Path]] = {}
+    for path in paths:
+        devices.setdefault(get_device(path), []).append(path)
+
+    queues = []
+    for device, device_paths in devices.items():
+        if is_rotational(device) is False:
+            queues.extend([path] for path in device_paths)
+        else:
+            queues.append(device_paths)
+
+    return queues
+
+
+def _prehash_input(
+    path: Path,
+    hash_cache: DiskCache,
+    version: str,
+    threads: int | None,
+    read_options: ReadOptions | None,
+    callback: Callable[[str, int, int], None],
+    torrent_file: Path | None = None,
+    checkpoint_interval: float = 60,
+    cancel: threading.Event | None = None,
+) -> None:
+    """
+    Hash `path` into the hash cache, so creating its torrent is a cache hit.
+
+    `callback` gets the hashed and total size in bytes. v1 pieces are
+    checkpointed next to `torrent_file` like `create_torrent` does it, so an
+    interrupted run resumes from either.
+    """
+    scanned = scan(path, EXCLUDE_REGEX)
+    if not scanned.files:
+        return
+    torrent = _init_torrent(path, [], scanned)
+    if version != "1":
+        torrent.piece_size = _aligned_piece_size(scanned, hash_cache, torrent.piece_size)
+    piece_size = torrent.piece_size
+
+    def report(current: str, done: int, total: int) -> None:
+        callback(current, done * piece_size, total * piece_size)
+
+    if version != "1":
+        files = [(file.path, file.size) for file in scanned.files]
+        keys = [_file_hashes_key(file.stat, torrent.piece_size) for file in scanned.files]
+        v1 = version != "2"
+        missing = [
+            num
+            for num, key in enumerate(keys)
+            if _load_file_hashes(hash_cache, key, v1) is None
+        ]
+        hasher = FileHasher(
+            torrent.piece_size,
+            threads=threads,
+            v1=v1,
+            options=read_options,
+            cancel=cancel,
+        )
+        new = hasher.hash([files[num] for num in missing], callback=report)
+        for num, file_hashes in zip(missing, new, strict=True):
+            _store_file_hashes(hash_cache, keys[num], file_hashes, v1)
+        return
+
+    stats = [file.stat for file in scanned.files]
+    hashes = _load_cached_pieces(torrent, hash_cache, stats)
+
+    key = _pieces_cache_key(torrent, stats)
+    checkpoint_file = None
+    if torrent_file and checkpoint_interval:
+        checkpoint_file = torrent_file.with_name(f"{torrent_file.name}.part")
+        hashes.update(_load_checkpoint(checkpoint_file, key, torrent.pieces))
+
+    def checkpoint(done: dict[int, bytes]) -> None:
+        assert checkpoint_file
+        checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        _save_checkpoint(checkpoint_file, key, torrent.pieces, hashes | done)
+
+    missing = [index for index in range(torrent.pieces) if index not in hashes]
+    hashes.update(
+        PieceHasher(
+            [(file.path, file.size) for file in scanned.files],
+            torrent.piece_size,
+            threads=threads,
+            options=read_options,
+            cancel=cancel,
+        ).hash(
+            missing,
+            callback=report,
+            checkpoint=checkpoint if checkpoint_file else None,
+            checkpoint_interval=checkpoint_interval,
+        )
+    )
+    torrent.metainfo["info"]["pieces"] = b"".join(
+        hashes[index] for index in range(torrent.pieces)
+    )
+    _store_cached_pieces(torrent, hash_cache, stats)
+    if checkpoint_file:
+        checkpoint_file.unlink(missing_ok=True)
+
+
+def prehash_inputs(
+    paths: list[Path],
+    hash_cache: DiskCache,
+    version: str = "1",
+    read_options: ReadOptions | None = None,
+    threads: int | None = None,
+    torrent_files: dict[Path, Path] | None = None,
+    checkpoint_interval: float = 60,
+) -> None:
+    """
+    Hash several inputs into the hash cache, concurrently across devices.
+
+    Every device queue runs on its own thread. Inputs on a rotational device are
+    hashed one after another by a single reader thread to avoid seeking, inputs
+    on SSDs or on a device of unknown type use the whole hashing pool.
+
+    `torrent_files` maps an input to the torrent `create_torrent` writes for it,
+    its checkpoint is shared. On Ctrl-C every queue stops and saves it.
+    """
+    if not (queues := group_by_device([path for path in paths if path.exists()])):
+        return
+
+    rotational = {
+        get_device(queue[0]): is_rotational(get_device(queue[0])) for queue in queues
+    }
+
+    iprint(f"Hashing {len(paths)} inputs on {len(rotational)} devices...", 0)
+
+    torrent_files = torrent_files or {}
+    cancel = threading.Event()
+
+    with get_progress() as progress, ThreadPoolExecutor(len(queues)) as executor:
+
+        def run_queue(queue: list[Path]) -> None:
+            workers = 1 if rotational[get_device(queue[0])] is True else threads
+            for path in queue:
+                if cancel.is_set():
+                    return
+                task = progress.add_task(
+                    description=f"[bold magenta]{path.name}[not bold white]"
+                )
+
+                def update(_: str, done: int, total: int, task=task) -> None:
+                    progress.update(task, completed=done, total=total)
+
+                try:
+                    _prehash_input(
+                        path,
+                        hash_cache,
+                        version,
+                        workers,
+                        read_options,
+                        update,
+                        torrent_files.get(path),
+                        checkpoint_interval,
+                        cancel,
+                    )
+                except OSError as e:
+                    progress.console.print(f"[yellow]Skipping {path.name}: {e}")
+
+        futures = [executor.submit(run_queue, queue) for queue in queues]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Stop the other queues too, the executor waits for them on exit
+            cancel.set()
+            for future in futures:
+                future.cancel()
+            raise
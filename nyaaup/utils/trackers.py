@@ -0,0 +1,200 @@
+import asyncio
+import os
+import struct
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from urllib.parse import urlencode, urlsplit
+
+from nyaaup.utils.cache import DiskCache, pack, unpack
+
+PROBE_TIMEOUT = 3.0
+PROBE_TTL = 6 * 60 * 60  # 6 hours
+MAX_CONCURRENCY = 32
+UDP_PROTOCOL_ID = 0x41727101980  # BEP 15 magic constant
+CHECK_MODES = ("drop", "reorder")
+SCHEMES = ("udp", "http", "https")
+
+
+@dataclass
+class TrackerStatus:
+    url: str
+    alive: bool
+    latency: float | None = None
+    error: str = ""
+
+
+class _UdpConnect(asyncio.DatagramProtocol):
+    def __init__(self, transaction_id: int):
+        self.transaction_id = transaction_id
+        self.response: asyncio.Future[bytes] = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, _addr) -> None:
+        if not self.response.done():
+            self.response.set_result(data)
+
+    def error_received(self, exc: Exception) -> None:
+        if not self.response.done():
+            self.response.set_exception(exc)
+
+
+async def _probe_udp(host: str, port: int) -> None:
+    """Send a BEP 15 connect request and wait for a matching response."""
+    transaction_id = int.from_bytes(os.urandom(4), "big")
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: _UdpConnect(transaction_id), remote_addr=(host, port)
+    )
+    try:
+        transport.sendto(struct.pack(">QII", UDP_PROTOCOL_ID, 0, transaction_id))
+        data = await protocol.response
+    finally:
+        transport.close()
+
+    if len(data) < 16:
+        raise ConnectionError("Short connect response")
+    action, received_id = struct.unpack(">II", data[:8])
+    if action != 0 or received_id != transaction_id:
+        raise ConnectionError("Invalid connect response")
+
+
+async def _probe_http(url: str) -> None:
+    """Send a minimal announce and accept any HTTP response below 500."""
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    query = urlencode(
+        {
+            "info_hash": bytes(20),
+            "peer_id": b"-NU0001-" + os.urandom(6).hex().encode()[:12],
+            "port": 6881,
+            "uploaded": 0,
+            "downloaded": 0,
+            "left": 0,
+            "compact": 1,
+            "numwant": 0,
+        }
+    )
+    path = f"{parts.path or '/'}?{f'{parts.query}&' if parts.query else ''}{query}"
+
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=secure)
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+            "User-Agent: nyaaup\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+    finally:
+        writer.close()
+
+    fields = status_line.split()
+    if len(fields) < 2 or not fields[0].startswith(b"HTTP/"):
+        raise ConnectionError("Invalid HTTP response")
+    if int(fields[1]) >= 500:
+        raise ConnectionError(f"HTTP {int(fields[1])}")
+
+
+async def probe_tracker(url: str, timeout: float = PROBE_TIMEOUT) -> TrackerStatus:
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    try:
+        if parts.scheme == "udp":
+            if not parts.hostname or not parts.port:
+                raise ValueError("Missing host or port")
+            await asyncio.wait_for(_probe_udp(parts.hostname, parts.port), timeout)
+        elif parts.scheme in ("http", "https"):
+            await asyncio.wait_for(_probe_http(url), timeout)
+        else:
+            raise ValueError(f"Unsupported scheme: {parts.scheme}")
+    # asyncio.TimeoutError is not TimeoutError before Python 3.11
+    except (TimeoutError, asyncio.TimeoutError):  # noqa: UP041
+        return TrackerStatus(url, alive=False, error="timeout")
+    except (OSError, ValueError) as e:
+        return TrackerStatus(url, alive=False, error=str(e) or type(e).__name__)
+
+    return TrackerStatus(url, alive=True, latency=time.perf_counter() - start)
+
+
+async def probe_trackers(
+    urls: Iterable[str],
+    timeout: float = PROBE_TIMEOUT,
+    concurrency: int = MAX_CONCURRENCY,
+) -> list[TrackerStatus]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(url: str) -> TrackerStatus:
+        async with semaphore:
+            return await probe_tracker(url, timeout)
+
+    return await asyncio.gather(*(probe(url) for url in urls))
+
+
+def check_trackers(
+    urls: list[str],
+    cache: DiskCache | None = None,
+    ttl: int = PROBE_TTL,
+    timeout: float = PROBE_TIMEOUT,
+) -> dict[str, TrackerStatus]:
+    """
+    Probe `urls` concurrently, reusing results cached for less than `ttl` seconds.
+
+    URLs with other schemes (like WebTorrent wss://) are not probed.
+    """
+    statuses: dict[str, TrackerStatus] = {}
+    now = time.time()
+
+    urls = [url for url in dict.fromkeys(urls) if urlsplit(url).scheme in SCHEMES]
+    for url in urls:
+        if cache and (value := cache.get(f"tracker:{url}")):
+            header, _ = unpack(value)
+            if now - header["checked"] < ttl:
+                statuses[url] = TrackerStatus(
+                    url, header["alive"], header["latency"], header["error"]
+                )
+
+    if missing := [url for url in urls if url not in statuses]:
+        for status in asyncio.run(probe_trackers(missing, timeout)):
+            statuses[status.url] = status
+            if cache:
+                cache.set(
+                    f"tracker:{status.url}",
+                    pack(
+                        {
+                            "checked": now,
+                            "alive": status.alive,
+                            "latency": status.latency,
+                            "error": status.error,
+                        }
+                    ),
+                )
+
+    return statuses
+
+
+def filter_announces(
+    announces: list[str],
+    statuses: dict[str, TrackerStatus],
+    mode: str = "drop",
+    keep: Iterable[str] = (),
+) -> list[str]:
+    """
+    Drop or move unreachable trackers to the end, fastest trackers first.
+
+    Trackers in `keep` stay in front in their original order, trackers without a
+    status are kept after the reachable ones.
+    """
+    keep = [url for url in dict.fromkeys(keep) if url in announces]
+    rest = [url for url in dict.fromkeys(announces) if url not in keep]
+
+    def latency(url: str) -> tuple[bool, float]:
+        status = statuses.get(url)
+        return status is None or status.latency is None, (status and status.latency) or 0
+
+    alive = sorted(
+        (url for url in rest if url not in statuses or statuses[url].alive),
+        key=latency,
+    )
+    dead = [url for url in rest if url not in alive]
+
+    return keep + alive + (dead if mode == "reorder" else [])
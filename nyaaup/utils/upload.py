@@ -21,6 +21,7 @@ from tls_client import Session
 
 from nyaaup.utils import which
 from nyaaup.utils.logging import eprint, wprint
+from nyaaup.utils.priority import idle_command
 
 if TYPE_CHECKING:
     from nyaaup.utils.uploader import Uploader
@@ -92,8 +93,8 @@ async def _generate_snapshot(
         if not (executable := which("ffmpeg")):
             eprint("ffmpeg not found", fatal=True)
 
-        process = await asyncio.create_subprocess_exec(
-            executable,
+        command = [
+            str(executable),
             "-y",
             "-v",
             "error",
@@ -110,6 +111,12 @@ async def _generate_snapshot(
             "-frames:v",
             "1",
             str(out_path),
+        ]
+        if upload_config.idle:
+            command = idle_command(command)
+
+        process = await asyncio.create_subprocess_exec(
+            *command,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
@@ -213,16 +220,29 @@ async def _get_snapshot_links(
     return images
 
 
+async def get_snapshot_links(
+    uploader: "Uploader",
+    input_file: Path | str = "",
+    duration: float | int = 0,
+) -> list[str]:
+    return await _get_snapshot_links(
+        uploader.upload_config, uploader.cache_dir, input_file, duration
+    )
+
+
 async def get_snapshot_tree(
     uploader: "Uploader",
     input_file: Path | str = "",
     duration: float | int = 0,
 ) -> "Tree":
-    images = Tree("[bold white]Images[not bold]")
+    snapshot_links = await get_snapshot_links(uploader, input_file, duration)
 
-    snapshot_links = await _get_snapshot_links(
-        uploader.upload_config, uploader.cache_dir, input_file, duration
-    )
+    return format_snapshot_tree(uploader, snapshot_links)
+
+
+def format_snapshot_tree(uploader: "Uploader", snapshot_links: list[str]) -> "Tree":
+    """Append the snapshot table to the description and return the display tree."""
+    images = Tree("[bold white]Images[not bold]")
 
     num_images = len(snapshot_links)
     columns = 0
@@ -2,9 +2,11 @@ import asyncio
 import re
 import shutil
 import sys
+import threading
 import time
 import urllib.parse
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Any
@@ -12,16 +14,42 @@ from typing import Any
 import cloup
 import niquests
 import orjson
-from pymediainfo import MediaInfo
+from rich import get_console
 from rich.console import Console
 from rich.tree import Tree
 
 from nyaaup.utils import Category, cat_help, tg_post
+from nyaaup.utils.cache import DiskCache
+from nyaaup.utils.collections import first_or_none
+from nyaaup.utils.creator import auto_backend
+from nyaaup.utils.databases import process_anilist_info, process_mal_info
+from nyaaup.utils.hasher import ReadOptions
 from nyaaup.utils.logging import eprint, wprint
-from nyaaup.utils.mediainfo import get_description, parse_mediainfo
+from nyaaup.utils.mediainfo import (
+    MediaInfoResult,
+    format_timings,
+    get_description,
+    parse_batch,
+    parse_mediainfo,
+)
 from nyaaup.utils.regex import find
-from nyaaup.utils.torrent import create_torrent, get_public_trackers
-from nyaaup.utils.upload import get_snapshot_tree, rentry_upload
+from nyaaup.utils.resume import fast_resume, push_to_qbittorrent
+from nyaaup.utils.scanner import ScanResult, scan
+from nyaaup.utils.torrent import (
+    EXCLUDE_REGEX,
+    TorrentVariant,
+    create_torrent,
+    get_public_trackers,
+    prehash_inputs,
+    torrenttools_unsupported,
+)
+from nyaaup.utils.trackers import CHECK_MODES, check_trackers, filter_announces
+from nyaaup.utils.upload import (
+    format_snapshot_tree,
+    get_snapshot_links,
+    get_snapshot_tree,
+    rentry_upload,
+)
 from nyaaup.utils.userconfig import Config
 
 
@@ -31,6 +59,15 @@ class Provider:
     domain: str
     proxy: str
     credentials: SimpleNamespace
+    announces: list[str] = field(default_factory=list)
+    add_pub_trackers: bool = False
+    # Upload a torrent with only this provider's trackers
+    own_announces: bool = False
+    source: str | None = None
+
+    @property
+    def has_variant(self) -> bool:
+        return self.own_announces or bool(self.source)
 
 
 @dataclass
@@ -46,6 +83,7 @@ class ProcessResult:
     audio_len: int
     sub_len: int
     display_info: Tree
+    name_plus: list[str]
 
 
 class Uploader:
@@ -55,16 +93,30 @@ class Uploader:
         self.announces: list[str] = []
         self.add_pub_trackers: bool = False
 
-        self.console: Console = Console()
+        # Shared with the progress bars, so concurrent stages do not fight over
+        # the terminal
+        self.console: Console = get_console()
         self.mediainfo = []
         self.description: str = ""
         self.file: str | Path = ""
+        self.scanned: ScanResult | None = None
         self.cache_dir: str | Path = ""
 
         self.config: Config = None  # type: ignore
         self.upload_config: SimpleNamespace = None  # type: ignore
         self.providers: list[Provider] = []
         self.headers: dict[str, str] = {}
+        self.hash_cache: DiskCache | None = None
+        self.mediainfo_cache: DiskCache | None = None
+        self.batch_mediainfo: bool = True
+        self.read_options: ReadOptions | None = None
+        self.checkpoint_interval: float = 60
+        self.hash_threads: int | None = None
+        self.prehash_enabled: bool = True
+        self._cookies_valid: dict[str, bool] = {}
+        self.snapshots_added: bool = False
+        # Torrents added to the torrent client, providers may share one
+        self.pushed: set[Path] = set()
 
         self._validate_inputs()
         self._setup_config()
@@ -77,14 +129,74 @@ class Uploader:
     def is_non_english_category(self) -> bool:
         return self.upload_config.category in {"1_3", "1_4"}
 
+    @property
+    def duration(self) -> float:
+        video = first_or_none([x for x in self.mediainfo if x["@type"] == "Video"])
+
+        return (
+            float(video.get("Duration"))
+            if video
+            else float(self.mediainfo[0].get("Duration"))
+        )
+
+    def prehash(self, paths: list[Path]) -> None:
+        """Hash all inputs up front, concurrently across disks, into the hash cache."""
+        if len(paths) < 2 or not self.prehash_enabled or not self.hash_cache:
+            return
+
+        # torrenttools hashes on its own and does not use the hash cache
+        if self.upload_config.torrent_creator == "auto":
+            paths = [
+                path
+                for path in paths
+                if path.exists()
+                and self._get_torrent_creator(scan(path, EXCLUDE_REGEX).total_size)
+                != "torrenttools"
+            ]
+        elif self.upload_config.torrent_creator == "torrenttools" and not (
+            torrenttools_unsupported(self.read_options)
+        ):
+            return
+        if len(paths) < 2:
+            return
+
+        prehash_inputs(
+            paths,
+            self.hash_cache,
+            version=self.args.torrent_version.lower(),
+            read_options=self.read_options,
+            threads=self.hash_threads,
+            torrent_files={path: self._torrent_file(path) for path in paths},
+            checkpoint_interval=self.checkpoint_interval,
+        )
+
+    def _torrent_file(self, file_path: Path) -> Path:
+        """The torrent `process_file` creates for `file_path`."""
+        name = self.get_file_name(file_path)
+
+        return Path(f"{self.config.dirs.user_cache_path}/{name}_files/{name}.torrent")
+
+    def _get_torrent_creator(self, size: int) -> str:
+        if self.upload_config.torrent_creator == "auto":
+            return auto_backend(
+                self.config.dirs.user_cache_path,
+                size,
+                self.hash_threads,
+                version=self.args.torrent_version.lower(),
+                read_options=self.read_options,
+                checkpoint_interval=self.checkpoint_interval,
+            )
+
+        return self.upload_config.torrent_creator
+
     def process_file(self, file_path: Path, display_info: Tree) -> ProcessResult | None:
         if not file_path.exists():
             eprint(f"Input path not found: {file_path}", True)
 
+        # One walk of the input feeds video detection, piece sizing and hashing
+        self.scanned = scan(file_path, EXCLUDE_REGEX)
         self.file = (
-            file_path
-            if file_path.is_file()
-            else Path(sorted([*file_path.glob("*.mkv"), *file_path.glob("*.mp4")])[0])
+            file_path if self.scanned.is_file else first_or_none(self.scanned.videos)
         )
 
         if not self.file:
@@ -92,23 +204,91 @@ class Uploader:
 
         name = self.get_file_name(file_path)
 
-        self.cache_dir = Path(f"{self.config.dirs.user_cache_path}/{name}_files")
+        self.cache_dir = self._torrent_file(file_path).parent
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
-        with self.console.status("[bold magenta]Parsing file...") as _:
-            self.mediainfo = parse_mediainfo(self.file)
-
-        if not self.mediainfo:
-            return None
-
-        if not create_torrent(
+        return asyncio.run(self._run_stages(file_path, name, display_info))
+
+    async def _run_stages(
+        self, file_path: Path, name: str, display_info: Tree
+    ) -> ProcessResult | None:
+        """
+        Run the per-file stages concurrently, each waiting only on its inputs:
+
+            torrent hashing ─────────────────────────┐
+            database lookup ─────────────────────────┤
+            mediainfo ──┬──> Rentry upload ──────────┼──> Nyaa upload
+                        ├──> description ────────────┤
+                        └──> snapshots ──> kek.sh ───┘
+
+        Blocking stages run on worker threads, snapshots on the event loop. On
+        Ctrl-C hashing is cancelled and waited for, so it saves its checkpoint.
+        """
+        cancel = threading.Event()
+        executor = ThreadPoolExecutor(1)
+        hashing = executor.submit(
+            create_torrent,
             name,
             file_path,
             self.cache_dir,
             self.announces,
             self.args.overwrite,
-            self.upload_config.torrent_creator,
-        ):
+            self._get_torrent_creator(self.scanned.total_size),
+            hash_cache=self.hash_cache,
+            version=self.args.torrent_version.lower(),
+            scanned=self.scanned,
+            read_options=self.read_options,
+            verify=self.args.verify.lower(),
+            checkpoint_interval=self.checkpoint_interval,
+            threads=self.hash_threads,
+            variants=self._torrent_variants(name),
+            cancel=cancel,
+        )
+
+        try:
+            return await self._finish_stages(
+                asyncio.wrap_future(hashing), name, display_info
+            )
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            cancel.set()
+            wait([hashing])
+            raise
+        finally:
+            executor.shutdown(wait=False)
+
+    async def _finish_stages(
+        self, torrent: asyncio.Future, name: str, display_info: Tree
+    ) -> ProcessResult | None:
+        """Run the stages besides hashing and wait for all of them."""
+        database = asyncio.create_task(
+            asyncio.to_thread(self._process_database_info, name, display_info)
+        )
+
+        parsed = await asyncio.to_thread(self._parse_mediainfo)
+        self.mediainfo = parsed.tracks
+
+        # The Rentry text comes from the same parse, the file is not read again
+        mediainfo_upload = (
+            asyncio.create_task(asyncio.to_thread(self._upload_mediainfo, parsed.text))
+            if self.upload_config.mediainfo_enabled
+            else None
+        )
+
+        snapshots = None
+        if self.mediainfo and await asyncio.to_thread(self._needs_early_snapshots):
+            snapshots = asyncio.create_task(
+                get_snapshot_links(self, input_file=self.file, duration=self.duration)
+            )
+
+        # Every stage must finish before returning, the upload depends on all of
+        # them. Snapshot failures are only warnings, see below.
+        stages = [x for x in (torrent, database, mediainfo_upload, snapshots) if x]
+        results = await asyncio.gather(*stages, return_exceptions=True)
+        for stage, result in zip(stages, results, strict=True):
+            if stage is not snapshots and isinstance(result, BaseException):
+                raise result
+
+        if not self.mediainfo or not torrent.result():
             return None
 
         video_info, audio_info, audio_len, sub_info, sub_len = get_description(
@@ -125,28 +305,99 @@ class Uploader:
             self.mediainfo,
         )
 
-        if self.upload_config.mediainfo_enabled:
-            mediainfo = MediaInfo.parse(self.file, output="", full=False)
+        if mediainfo_upload and (upload := mediainfo_upload.result()):
+            url = upload["url"]
+            display_info = self._add_media_info_display(
+                display_info, url, upload["edit_code"]
+            )
+            self.description += f"\n[Full MediaInfo]({url})"
 
-            if not mediainfo:
-                eprint("Failed to parse mediainfo", True)
+        if self.upload_config.pic_num > 0:
+            self.description += "\n\n---\n\n"
 
-            self.upload_config.text = mediainfo.replace(
-                str(self.file), str(self.file.name)
-            )
-            if mediainfo_upload := self._upload_mediainfo():
-                url = mediainfo_upload["url"]
-                display_info = self._add_media_info_display(
-                    display_info, url, mediainfo_upload["edit_code"]
-                )
-                self.description += f"\n[Full MediaInfo]({url})"
+        if snapshots:
+            try:
+                if images := format_snapshot_tree(self, snapshots.result()):
+                    display_info.add(images)
+                    self.snapshots_added = True
+            except Exception as e:
+                wprint(f"Failed to upload images: {e}")
+                self.upload_config.pic_num = 0
 
         return ProcessResult(
             audio_len=audio_len,
             sub_len=sub_len,
             display_info=display_info,
+            name_plus=database.result(),
+        )
+
+    def _parse_mediainfo(self) -> MediaInfoResult:
+        """Parse the video, or every episode of a batch folder and describe them as one."""
+        videos = self.scanned.videos if self.scanned else []
+        if not self.batch_mediainfo or len(videos) < 2:
+            with self.console.status("[bold magenta]Parsing file...") as _:
+                result = parse_mediainfo(
+                    self.file,
+                    cache=self.mediainfo_cache,
+                    text=self.upload_config.mediainfo_enabled,
+                )
+                self._print_probes({self.file: result})
+                return result
+
+        with self.console.status(f"[bold magenta]Parsing {len(videos)} files...") as _:
+            batch = parse_batch(
+                videos,
+                cache=self.mediainfo_cache,
+                text=self.upload_config.mediainfo_enabled,
+            )
+            self._print_probes(batch.episodes)
+
+        for path, reason in batch.outliers.items():
+            wprint(f"{path.name} differs from the other episodes: {reason}")
+        # Snapshots and the description come from an episode of the common layout
+        self.file = batch.file
+
+        return batch.result
+
+    def _print_probes(self, results: dict[Path, MediaInfoResult]) -> None:
+        """Show the probe tier and its timings of every file that was not cached."""
+        for path, result in results.items():
+            if result.timings:
+                self.console.print(
+                    f"[dim]MediaInfo of {path.name}: {format_timings(result)}"
+                )
+
+    def _needs_early_snapshots(self) -> bool:
+        """Snapshots go into the first upload unless every provider allows editing."""
+        return (
+            self.upload_config.pic_num > 0
+            and not self.args.skip_upload
+            and not all(self.check_cookies(provider) for provider in self.providers)
         )
 
+    def _process_database_info(self, name: str, display_info: Tree) -> list[str]:
+        """Process AniList/MAL information and return title additions."""
+        name_plus = []
+        if self.is_anime_category and not self.args.skip_database:
+            if not self.upload_config.info_form_config:
+                if self.upload_config.database == "myanimelist":
+                    if mal_title := process_mal_info(self, name):
+                        name_plus.append(mal_title)
+                    elif anilist_title := process_anilist_info(self, name):
+                        name_plus.append(anilist_title)
+                elif self.upload_config.database == "anilist":
+                    if anilist_title := process_anilist_info(self, name):
+                        name_plus.append(anilist_title)
+                    elif mal_title := process_mal_info(self, name):
+                        name_plus.append(mal_title)
+
+            if self.upload_config.info:
+                display_info.add(
+                    f"[bold white]Database link: [cornflower_blue not bold]"
+                    f"{self.upload_config.info}[white]"
+                )
+        return name_plus
+
     def _set_description(
         self,
         video_info: str,
@@ -177,7 +428,12 @@ class Uploader:
             f"* `Duration:` **~{duration_str}**\n"
         )
 
-    def _upload_mediainfo(self) -> dict | None:
+    def _upload_mediainfo(self, mediainfo: str) -> dict | None:
+        if not mediainfo:
+            eprint("Failed to parse mediainfo", True)
+
+        self.upload_config.text = mediainfo.replace(str(self.file), str(self.file.name))
+
         try:
             return rentry_upload(self.upload_config)
         except Exception as e:
@@ -185,10 +441,35 @@ class Uploader:
 
             return None
 
+    def torrent_path(self, name: str, provider: Provider | None = None) -> Path:
+        """The torrent of `provider` if it needs its own variant, else the shared one."""
+        if provider and provider.has_variant:
+            slug = re.sub(r"[^\w.-]+", "_", provider.name or provider.domain)
+            return Path(self.cache_dir) / f"{name}.{slug}.torrent"
+
+        return Path(self.cache_dir) / f"{name}.torrent"
+
+    def _torrent_variants(self, name: str) -> list[TorrentVariant]:
+        """Per provider torrents, written from the shared one without hashing again."""
+        provider_urls = {url for provider in self.providers for url in provider.announces}
+        public = [url for url in self.announces if url not in provider_urls]
+
+        return [
+            TorrentVariant(
+                self.torrent_path(name, provider),
+                (provider.announces + (public if provider.add_pub_trackers else []))
+                if provider.own_announces
+                else self.announces,
+                provider.source,
+            )
+            for provider in self.providers
+            if provider.has_variant
+        ]
+
     def try_upload_with_retries(
         self, display_name: str, name: str, provider: Provider, max_retries: int = 3
     ) -> UploadResult | None:
-        torrent_path = Path(self.cache_dir) / f"{name}.torrent"
+        torrent_path = self.torrent_path(name, provider)
         with torrent_path.open("rb") as f:
             torrent_data = f.read()
 
@@ -235,6 +516,12 @@ class Uploader:
         return f"{name_nyaa} ({', '.join(name_plus)})" if name_plus else name_nyaa
 
     def check_cookies(self, provider: Provider) -> bool:
+        if provider.name not in self._cookies_valid:
+            self._cookies_valid[provider.name] = self._check_cookies(provider)
+
+        return self._cookies_valid[provider.name]
+
+    def _check_cookies(self, provider: Provider) -> bool:
         if self.config.cookies:
             try:
                 res = niquests.get(
@@ -307,14 +594,44 @@ class Uploader:
 
         return display_info
 
-    def copy_to_watch_dir(self, file_path: Path, watch_dir: Path) -> bool:
+    def copy_to_watch_dir(
+        self, file_path: Path, watch_dir: Path, provider: Provider | None = None
+    ) -> bool:
         name = self.get_file_name(file_path)
-        torrent_file = Path(f"{self.cache_dir}/{name}.torrent")
+        torrent_file = self.torrent_path(name, provider)
+
+        # Before the torrent, so it is there when the client picks the torrent up
+        if self.upload_config.fast_resume:
+            resume = fast_resume(torrent_file, file_path.parent.absolute())
+            (watch_dir / f"{torrent_file.stem}.fastresume").write_bytes(resume)
 
         shutil.copy(torrent_file, watch_dir)
 
         return (watch_dir / torrent_file.name).exists()
 
+    def push_to_client(self, file_path: Path, provider: Provider | None = None) -> bool:
+        """
+        Add the torrent to qBittorrent, seeding `file_path` without a recheck.
+        Return False if it was already added for another provider.
+        """
+        torrent_file = self.torrent_path(self.get_file_name(file_path), provider)
+        if torrent_file in self.pushed:
+            return False
+
+        save_path = (
+            self.upload_config.qbittorrent_save_path or file_path.parent.absolute()
+        )
+        push_to_qbittorrent(
+            self.upload_config.qbittorrent_url,
+            torrent_file,
+            Path(save_path),
+            self.upload_config.qbittorrent_credentials,
+            self.upload_config.qbittorrent_category,
+        )
+        self.pushed.add(torrent_file)
+
+        return True
+
     @staticmethod
     def get_file_name(file_path: Path) -> str:
         if file_path.is_file():
@@ -345,12 +662,76 @@ class Uploader:
         pref = self._validate_config()
         self._init_upload_config(pref)
 
+        if cache_size := pref.get("hash_cache_size", 100):
+            self.hash_cache = DiskCache(
+                self.config.dirs.user_cache_path / "hashes.sqlite",
+                max_size=int(cache_size) * 1024 * 1024,
+            )
+
+        if cache_size := pref.get("mediainfo_cache_size", 10):
+            self.mediainfo_cache = DiskCache(
+                self.config.dirs.user_cache_path / "mediainfo.sqlite",
+                max_size=int(cache_size) * 1024 * 1024,
+            )
+
+        self.batch_mediainfo = bool(pref.get("mediainfo_batch", True))
+
+        bwlimit = self.args.bwlimit
+        if bwlimit is None:
+            bwlimit = pref.get("hash_bwlimit") or 0
+        self.read_options = ReadOptions(
+            read_size=int(pref.get("hash_read_size", 8)) * 1024 * 1024,
+            drop_cache=bool(pref.get("hash_drop_cache", False)),
+            direct_io=bool(pref.get("hash_direct_io", False)),
+            bwlimit=int(float(bwlimit) * 1_000_000),
+            idle=self.upload_config.idle,
+        )
+
+        self.checkpoint_interval = float(pref.get("hash_checkpoint_interval", 60))
+        self.hash_threads = int(pref.get("hash_threads") or 0) or None
+        self.prehash_enabled = bool(pref.get("prehash", True))
+
         self.providers = self._setup_providers()
         if self.add_pub_trackers:
-            self.announces = list(dict.fromkeys(self.announces + get_public_trackers()))
+            trackers = get_public_trackers(
+                self.config.dirs.user_cache_path,
+                ttl=int(pref.get("public_trackers_ttl", 24) * 60 * 60),
+            )
+            self.announces = list(dict.fromkeys(self.announces + trackers))
+
+        if mode := str(pref.get("check_trackers") or "").lower():
+            self._check_announces(mode, pref)
 
         self._setup_headers(pref)
 
+    def _check_announces(self, mode: str, pref: dict[str, Any]) -> None:
+        if mode not in CHECK_MODES:
+            wprint(
+                f"Invalid check_trackers value {mode!r}, use {' or '.join(CHECK_MODES)}"
+            )
+            return
+
+        provider_announces = [
+            url
+            for provider_info in self.config.get("providers", {})
+            for url in provider_info.get("announces", [])
+        ]
+        statuses = check_trackers(
+            self.announces,
+            cache=DiskCache(
+                self.config.dirs.user_cache_path / "trackers.sqlite", max_size=1024 * 1024
+            ),
+            ttl=int(pref.get("tracker_check_ttl", 6) * 60 * 60),
+        )
+
+        announces = filter_announces(
+            self.announces, statuses, mode=mode, keep=provider_announces
+        )
+        if dead := [url for url, status in statuses.items() if not status.alive]:
+            action = "Dropped" if mode == "drop" else "Moved to the end"
+            wprint(f"{action} {len(dead)}/{len(statuses)} unreachable trackers")
+        self.announces = announces
+
     def _validate_config(self) -> dict[str, Any]:
         required = ["preferences", "providers"]
         for key in required:
@@ -378,7 +759,13 @@ class Uploader:
             telegram_enabled=self.args.telegram or pref.get("telegram", False),
             tg_id=pref.get("id"),
             watch_dir=dir_P if (dir_P := pref.get("watch_dir")) else None,
+            fast_resume=bool(pref.get("fast_resume", False)),
+            qbittorrent_url=pref.get("qbittorrent_url") or None,
+            qbittorrent_credentials=pref.get("qbittorrent_credentials") or "",
+            qbittorrent_category=pref.get("qbittorrent_category") or "",
+            qbittorrent_save_path=pref.get("qbittorrent_save_path") or None,
             random_snapshots=pref.get("random_snapshots", False),
+            idle=self.args.idle or bool(pref.get("idle_priority", False)),
             pic_num=self.args.pictures_number,
             pic_ext=self.args.picture_extension,
             edit_code=self.args.edit_code or pref.get("edit_code"),
@@ -437,6 +824,10 @@ class Uploader:
                 domain=domain,
                 proxy=provider_info.get("proxy", None),
                 credentials=self.config.credentials,
+                announces=list(provider_info.get("announces", [])),
+                add_pub_trackers=provider_info.get("add_pub_trackers", False),
+                own_announces=provider_info.get("own_announces", False),
+                source=provider_info.get("source"),
             )
 
             if provider_info.get("add_pub_trackers", False):
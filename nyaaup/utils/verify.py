@@ -0,0 +1,169 @@
+import math
+import random
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from nyaaup.utils.bencode import bdecode
+from nyaaup.utils.hasher import FileHasher, PieceHasher, ReadOptions
+from nyaaup.utils.scanner import ScanResult
+
+SAMPLE_PIECES = 32
+
+
+@dataclass
+class TorrentFile:
+    # Path inside the torrent, without the torrent name
+    parts: tuple[str, ...]
+    size: int
+    pad: bool = False
+    root: bytes = b""
+
+
+@dataclass
+class TorrentLayout:
+    """What an existing torrent file says about its content."""
+
+    name: str
+    piece_size: int
+    files: list[TorrentFile]
+    single: bool
+    # v1 SHA-1 piece hashes, empty for v2-only torrents
+    pieces: bytes = b""
+    piece_layers: dict[bytes, bytes] = field(default_factory=dict)
+
+
+def read_layout(torrent_file: Path) -> TorrentLayout:
+    """Read the file list and hashes of `torrent_file`, raise ValueError if invalid."""
+    try:
+        metainfo = bdecode(torrent_file.read_bytes())
+        info = metainfo[b"info"]
+        name = info[b"name"].decode()
+        piece_size = info[b"piece length"]
+    except (KeyError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid torrent: {e}") from e
+
+    if b"pieces" in info:
+        if b"files" in info:
+            files = [
+                TorrentFile(
+                    tuple(part.decode() for part in entry[b"path"]),
+                    entry[b"length"],
+                    pad=b"p" in entry.get(b"attr", b""),
+                )
+                for entry in info[b"files"]
+            ]
+        else:
+            files = [TorrentFile((name,), info[b"length"])]
+
+        return TorrentLayout(
+            name, piece_size, files, b"length" in info, pieces=info[b"pieces"]
+        )
+
+    files = []
+    _walk_file_tree(info.get(b"file tree", {}), (), files)
+    single = len(files) == 1 and files[0].parts == (name,)
+
+    return TorrentLayout(
+        name,
+        piece_size,
+        files,
+        single,
+        piece_layers=metainfo.get(b"piece layers", {}),
+    )
+
+
+def _walk_file_tree(node: dict, parts: tuple[str, ...], files: list[TorrentFile]) -> None:
+    for key, child in node.items():
+        if key == b"":
+            files.append(
+                TorrentFile(parts, child[b"length"], root=child.get(b"pieces root", b""))
+            )
+        else:
+            _walk_file_tree(child, (*parts, key.decode()), files)
+
+
+def compare_files(
+    layout: TorrentLayout, filename: Path, scanned: ScanResult
+) -> str | None:
+    """Return why the torrent's file list does not match `scanned`, None if it does."""
+    if layout.name != filename.name:
+        return f"name is {layout.name!r}"
+
+    if layout.single != scanned.is_file:
+        return "single/multi file layout changed"
+
+    expected = {file.parts: file.size for file in layout.files if not file.pad}
+    actual = {
+        file.parts if scanned.is_file else file.parts[1:]: file.size
+        for file in scanned.files
+    }
+
+    if missing := expected.keys() - actual.keys():
+        return f"{'/'.join(sorted(missing)[0])} is missing"
+    if added := actual.keys() - expected.keys():
+        return f"{'/'.join(sorted(added)[0])} was added"
+    for parts, size in expected.items():
+        if actual[parts] != size:
+            return f"size of {'/'.join(parts)} changed"
+
+    return None
+
+
+def _choose(total: int, mode: str) -> list[int]:
+    """All indices for `full`, else the first, the last and a random sample."""
+    if mode == "full" or total <= SAMPLE_PIECES + 2:
+        return list(range(total))
+
+    return sorted({0, total - 1, *random.sample(range(1, total - 1), SAMPLE_PIECES)})
+
+
+def verify_pieces(
+    layout: TorrentLayout,
+    filename: Path,
+    mode: str = "sample",
+    threads: int | None = None,
+    options: ReadOptions | None = None,
+    callback: Callable[[str, int, int], None] | None = None,
+) -> str | None:
+    """Hash the sampled (or all) pieces, return which one differs, None if all match."""
+
+    def disk_path(file: TorrentFile) -> Path:
+        return filename if layout.single else filename.joinpath(*file.parts)
+
+    if layout.pieces:
+        hasher = PieceHasher(
+            [(None if file.pad else disk_path(file), file.size) for file in layout.files],
+            layout.piece_size,
+            threads=threads,
+            options=options,
+        )
+        indices = _choose(hasher.pieces, mode)
+        hashes = hasher.hash(indices, callback=callback)
+        for index in indices:
+            if hashes[index] != layout.pieces[index * 20 : index * 20 + 20]:
+                return f"piece {index} differs"
+        return None
+
+    pieces = [
+        (file, index)
+        for file in layout.files
+        for index in range(math.ceil(file.size / layout.piece_size))
+    ]
+    sample = [pieces[num] for num in _choose(len(pieces), mode)]
+    nodes = FileHasher(
+        layout.piece_size, threads=threads, v1=False, options=options
+    ).hash_pieces(
+        [(disk_path(file), file.size, index) for file, index in sample], callback=callback
+    )
+    for (file, index), node in zip(sample, nodes, strict=True):
+        if file.size <= layout.piece_size:
+            expected = file.root
+        else:
+            expected = layout.piece_layers.get(file.root, b"")[
+                index * 32 : index * 32 + 32
+            ]
+        if node != expected:
+            return f"piece {index} of {'/'.join(file.parts)} differs"
+
+    return None